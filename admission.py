@@ -0,0 +1,171 @@
+"""
+Admission control for chat turns
+
+Each worker allows at most `max_inflight` chat turns through the NLP
+pipeline at once, and each user may start `user_rate` turns per second
+(bursts of `user_burst`). A turn that arrives when:
+
+- fewer than `degrade_at` turns are in flight runs in full;
+- `degrade_at` or more are in flight runs degraded (callers skip spaCy and
+  fresh recommendations);
+- all slots stay taken for `queue_timeout` seconds is shed;
+- its user has no tokens left is limited.
+
+Shed and limited turns get a quick canned or cached answer from the caller,
+except crisis messages: callers check those first and always run them. A
+shed turn gives its user's token back, so load alone never leads to 429s.
+"""
+import threading
+import time
+
+FULL = 'full'
+DEGRADED = 'degraded'
+SHED = 'shed'
+LIMITED = 'limited'
+
+
+class Ticket:
+    """Outcome of an admission request; holds a slot until released"""
+
+    def __init__(self, controller, level, holds_slot, retry_after=0.0):
+        self.controller = controller
+        self.level = level
+        self.retry_after = retry_after
+        self._holds_slot = holds_slot
+
+    @property
+    def degraded(self):
+        return self.level == DEGRADED
+
+    @property
+    def rejected(self):
+        """Shed or rate limited: no slot was granted"""
+        return self.level in (SHED, LIMITED)
+
+    def release(self):
+        """Give the slot back; safe to call more than once"""
+        if self._holds_slot:
+            self._holds_slot = False
+            self.controller._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class TokenBuckets:
+    """Per-key token buckets refilled at `rate` tokens/second up to `burst`"""
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Take a token; returns 0.0 on success, else seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                if key not in self._buckets and len(self._buckets) >= self.max_keys:
+                    self._evict(now)
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+    def give_back(self, key):
+        """Return a token taken by take() for work that didn't happen"""
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (min(self.burst, tokens + 1), updated)
+
+    def _evict(self, now):
+        """Forget buckets that have refilled completely (caller holds the lock)"""
+        full_after = self.burst / self.rate
+        for key in [k for k, (_, updated) in self._buckets.items() if now - updated >= full_after]:
+            del self._buckets[key]
+        while len(self._buckets) >= self.max_keys:
+            del self._buckets[next(iter(self._buckets))]
+
+
+class AdmissionController:
+    """Per-worker concurrency limit with a degraded band, plus per-user rate limits"""
+
+    def __init__(self):
+        self.max_inflight = 0
+        self.degrade_at = 0
+        self.queue_timeout = 0.0
+        self.user_buckets = None
+
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.counters = {FULL: 0, DEGRADED: 0, SHED: 0, LIMITED: 0, 'crisis_bypass': 0, 'cached_responses': 0}
+        self._slots = threading.Condition()
+
+    def init_app(self, app):
+        """Read CHAT_* limits from app config; 0 turns a limit off"""
+        self.max_inflight = app.config.get('CHAT_MAX_INFLIGHT', 0)
+        self.degrade_at = app.config.get('CHAT_DEGRADE_AT', 0) or self.max_inflight
+        self.queue_timeout = app.config.get('CHAT_QUEUE_TIMEOUT', 0.0)
+        rate = app.config.get('CHAT_USER_RATE', 0.0)
+        if rate > 0:
+            self.user_buckets = TokenBuckets(rate, max(1.0, app.config.get('CHAT_USER_BURST', 1.0)))
+
+    def admit(self, user_id, timeout=None, limit_rate=True):
+        """Ticket for one chat turn; waits up to `timeout` (default queue_timeout) for a slot
+
+        limit_rate=False skips the user's token bucket (crisis turns).
+        """
+        if limit_rate and self.user_buckets is not None:
+            retry_after = self.user_buckets.take(user_id)
+            if retry_after:
+                self.count(LIMITED)
+                return Ticket(self, LIMITED, False, retry_after)
+
+        if not self.max_inflight:
+            self.count(FULL)
+            return Ticket(self, FULL, False)
+
+        deadline = time.monotonic() + (self.queue_timeout if timeout is None else timeout)
+        with self._slots:
+            while self.inflight >= self.max_inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters[SHED] += 1
+                    if limit_rate and self.user_buckets is not None:
+                        self.user_buckets.give_back(user_id)
+                    return Ticket(self, SHED, False, self.queue_timeout or 1.0)
+                self._slots.wait(remaining)
+            self.inflight += 1
+            self.peak_inflight = max(self.peak_inflight, self.inflight)
+            level = DEGRADED if self.inflight > self.degrade_at else FULL
+            self.counters[level] += 1
+        return Ticket(self, level, True)
+
+    def _release(self):
+        with self._slots:
+            self.inflight -= 1
+            self._slots.notify()
+
+    def count(self, name):
+        """Bump a counter (also used by callers for crisis bypasses and cached answers)"""
+        with self._slots:
+            self.counters[name] += 1
+
+    def stats(self):
+        """Limits, current load and counters"""
+        return {
+            'max_inflight': self.max_inflight,
+            'degrade_at': self.degrade_at,
+            'inflight': self.inflight,
+            'peak_inflight': self.peak_inflight,
+            **self.counters
+        }
@@ -0,0 +1,155 @@
+from collections import namedtuple
+
+from sqlalchemy import select, update
+
+from models import db, SentimentBucket, get_ist_time
+from sharding import each_shard, user_shard
+
+GRANULARITIES = ('hour', 'day')
+ALL_USERS = 0
+
+BucketRow = namedtuple('BucketRow', 'bucket_start emotion count intensity_sum crisis_count')
+
+
+def bucket_start(timestamp, granularity):
+    """Truncate a timestamp to the start of its hour/day bucket"""
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def upsert_bucket(granularity, start, user_id, emotion, intensity, is_crisis):
+    """Add one observation to a bucket row, creating it if needed"""
+    table = SentimentBucket.__table__
+    crisis = 1 if is_crisis else 0
+    dialect = db.session.get_bind().dialect.name
+    
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        
+        stmt = insert(table).values(
+            granularity=granularity,
+            user_id=user_id,
+            bucket_start=start,
+            emotion=emotion,
+            count=1,
+            intensity_sum=intensity,
+            crisis_count=crisis
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['granularity', 'user_id', 'bucket_start', 'emotion'],
+            set_={
+                'count': table.c.count + 1,
+                'intensity_sum': table.c.intensity_sum + intensity,
+                'crisis_count': table.c.crisis_count + crisis
+            }
+        )
+        db.session.execute(stmt)
+        return
+    
+    # Other databases: update, then insert if the bucket doesn't exist yet
+    result = db.session.execute(
+        update(table)
+        .where(
+            table.c.granularity == granularity,
+            table.c.user_id == user_id,
+            table.c.bucket_start == start,
+            table.c.emotion == emotion
+        )
+        .values(
+            count=table.c.count + 1,
+            intensity_sum=table.c.intensity_sum + intensity,
+            crisis_count=table.c.crisis_count + crisis
+        )
+    )
+    if result.rowcount == 0:
+        db.session.execute(table.insert().values(
+            granularity=granularity,
+            user_id=user_id,
+            bucket_start=start,
+            emotion=emotion,
+            count=1,
+            intensity_sum=intensity,
+            crisis_count=crisis
+        ))
+
+
+def record_sentiment(user_id, sentiment_data, is_crisis=False, timestamp=None):
+    """Add a scored user message to the hourly and daily buckets (caller commits)"""
+    timestamp = timestamp or get_ist_time()
+    emotion = sentiment_data.get('emotion', 'neutral')
+    intensity = float(sentiment_data.get('intensity', 0.0) or 0.0)
+    
+    # Don't flush the turn's pending ORM rows early; they are written together at commit
+    with db.session.no_autoflush:
+        for granularity in GRANULARITIES:
+            start = bucket_start(timestamp, granularity)
+            for bucket_user in (user_id, ALL_USERS):
+                upsert_bucket(granularity, start, bucket_user, emotion, intensity, is_crisis)
+
+
+def _bucket_rows(granularity, start, end, user_id):
+    """Bucket rows of one database, ordered by bucket_start"""
+    return db.session.execute(
+        select(
+            SentimentBucket.bucket_start,
+            SentimentBucket.emotion,
+            SentimentBucket.count,
+            SentimentBucket.intensity_sum,
+            SentimentBucket.crisis_count
+        )
+        .where(
+            SentimentBucket.granularity == granularity,
+            SentimentBucket.user_id == (user_id or ALL_USERS),
+            SentimentBucket.bucket_start >= start,
+            SentimentBucket.bucket_start < end
+        )
+        .order_by(SentimentBucket.bucket_start)
+    ).all()
+
+
+def get_sentiment_trends(granularity, start, end, user_id=None):
+    """Bucket rows in [start, end) rolled up per bucket_start"""
+    if user_id:
+        with user_shard(user_id):
+            rows = _bucket_rows(granularity, start, end, user_id)
+    else:
+        # Each shard keeps all-users buckets for its own users; add them up
+        totals = {}
+        for _ in each_shard():
+            for row in _bucket_rows(granularity, start, end, None):
+                key = (row.bucket_start, row.emotion)
+                count, intensity_sum, crisis_count = totals.get(key, (0, 0.0, 0))
+                totals[key] = (count + row.count, intensity_sum + row.intensity_sum, crisis_count + row.crisis_count)
+        rows = [BucketRow(*key, *values) for key, values in sorted(totals.items())]
+    
+    buckets = []
+    for row in rows:
+        if not buckets or buckets[-1]['_start'] != row.bucket_start:
+            buckets.append({
+                '_start': row.bucket_start,
+                'bucket_start': row.bucket_start.strftime('%Y-%m-%d %H:%M:%S'),
+                'total': 0,
+                'crisis_count': 0,
+                'intensity_sum': 0.0,
+                'emotions': {}
+            })
+        bucket = buckets[-1]
+        bucket['total'] += row.count
+        bucket['crisis_count'] += row.crisis_count
+        bucket['intensity_sum'] += row.intensity_sum
+        bucket['emotions'][row.emotion] = {
+            'count': row.count,
+            'mean_intensity': round(row.intensity_sum / row.count, 3) if row.count else 0.0,
+            'crisis_count': row.crisis_count
+        }
+    
+    for bucket in buckets:
+        del bucket['_start']
+        intensity_sum = bucket.pop('intensity_sum')
+        bucket['mean_intensity'] = round(intensity_sum / bucket['total'], 3) if bucket['total'] else 0.0
+    
+    return buckets
@@ -18,33 +18,169 @@ except LookupError:
     print("Downloading NLTK vader_lexicon...")
     nltk.download('vader_lexicon')
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context, g, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from datetime import datetime
+from sqlalchemy import and_, or_, func, event
+from sqlalchemy.orm import object_session
+from datetime import datetime, timedelta
+import base64
+import math
+from contextlib import ExitStack
+from types import SimpleNamespace
+import click
+import json
 import secrets
+import threading
+import time
 
 from sentiment_analyzer import SentimentAnalyzer
 from dialogue_manager import DialogueManager
 from resource_recommender import ResourceRecommender
 from models import db, User, Conversation, Message, ConversationLog, UserSession, get_ist_time  # ✅ Added get_ist_time
+from models import upgrade_schema, backfill_conversation_stats, backfill_message_user_ids
+from models import seed_stat_counters, rebuild_stat_counters, get_stat_counters
+from models import delete_conversations, delete_user
+from models import USER_COLUMNS, CONVERSATION_COLUMNS, MESSAGE_COLUMNS, rows_to_dicts
+from analytics import record_sentiment, get_sentiment_trends, GRANULARITIES
+from exporter import iter_export_records, iter_ndjson
+from search import setup_message_search, search_messages, count_archived_conversations
+from retention import RetentionScheduler, purge_expired_conversations, RETENTION_ACTIONS
+from archive import archive_inactive_conversations, prune_conversation_logs, restore_conversation, load_archived_messages, archive_stats
+from archive import has_archived_sentiment, backfill_archived_sentiments
+from write_behind import WriteBehindQueue
+from cache import TTLCache
+from db_config import get_database_url, engine_options, configure_engine
+from sharding import router, use_shard, user_shard, each_shard
+from rebalance import rebalance_shards
+import metrics
+from metrics import timed
+from profiling import SamplingProfiler, ProfileStore
+from memory import MemoryTracker, orm_instance_roots
+from admission import AdmissionController
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///mindmend.db'
+# Set SECRET_KEY when running several workers so they all accept the same session cookies
+app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(16)
+app.config['SQLALCHEMY_DATABASE_URI'] = get_database_url()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Message history page sizes
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+ADMIN_MAX_PAGE_SIZE = 100
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE = 50
+
+# Write-behind queue for non-critical inserts (legacy conversation logs)
+app.config['WRITE_BEHIND_MAX_SIZE'] = int(os.environ.get('WRITE_BEHIND_MAX_SIZE', 10000))
+app.config['WRITE_BEHIND_FLUSH_INTERVAL'] = float(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL', 1.0))
+app.config['WRITE_BEHIND_BATCH_SIZE'] = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 200))
+
+# How long the admin dashboard stats may be served from memory
+app.config['ADMIN_STATS_TTL'] = float(os.environ.get('ADMIN_STATS_TTL', 5))
+
+# Seconds a worker trusts its cached copy of the logged-in user (id, username, is_admin);
+# updates and deletes on this worker invalidate it at once, other workers within this time
+app.config['PRINCIPAL_CACHE_TTL'] = float(os.environ.get('PRINCIPAL_CACHE_TTL', 30))
+
+# Conversation retention: set RETENTION_DAYS to purge conversations idle longer than that
+app.config['RETENTION_DAYS'] = int(os.environ.get('RETENTION_DAYS', 0))
+app.config['RETENTION_ACTION'] = os.environ.get('RETENTION_ACTION', 'delete')  # 'delete' or 'archive'
+app.config['RETENTION_ARCHIVE_DIR'] = os.environ.get('RETENTION_ARCHIVE_DIR', os.path.join(app.instance_path, 'archive'))
+app.config['RETENTION_BATCH_SIZE'] = int(os.environ.get('RETENTION_BATCH_SIZE', 500))
+app.config['RETENTION_INTERVAL_HOURS'] = float(os.environ.get('RETENTION_INTERVAL_HOURS', 24))
+# Held by the one serving process that runs the lifecycle job
+app.config['RETENTION_LOCK_FILE'] = os.environ.get('RETENTION_LOCK_FILE', os.path.join(app.instance_path, 'retention.lock'))
+
+# Cold storage: move conversations idle this many days into compressed blobs (0 = off)
+app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 0))
+# Delete legacy conversation_logs rows older than this many days (0 = keep)
+app.config['LOG_RETENTION_DAYS'] = int(os.environ.get('LOG_RETENTION_DAYS', 0))
+
+# Per-user sharding of conversations/messages across SQLite files (0 = everything on the main database)
+app.config['CONVERSATION_SHARDS'] = int(os.environ.get('CONVERSATION_SHARDS', 0))
+app.config['SHARD_DIR'] = os.environ.get('SHARD_DIR', os.path.join(app.instance_path, 'shards'))
+
+# Latency metrics: set METRICS_DIR (shared by all workers) to aggregate /metrics across gunicorn workers
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+# If set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+
+# Admin request profiling (X-Profile: 1 or ?profile=1): sample rate, time cap and profiles kept per worker
+app.config['PROFILE_SAMPLE_INTERVAL_MS'] = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 1))
+app.config['PROFILE_MAX_SECONDS'] = float(os.environ.get('PROFILE_MAX_SECONDS', 30))
+app.config['PROFILE_HISTORY'] = int(os.environ.get('PROFILE_HISTORY', 20))
+
+# Memory accounting: MEMORY_TRACE_FRAMES > 0 turns on tracemalloc (slows allocations; leave 0 normally)
+app.config['MEMORY_TRACE_FRAMES'] = int(os.environ.get('MEMORY_TRACE_FRAMES', 0))
+app.config['MEMORY_SNAPSHOTS'] = int(os.environ.get('MEMORY_SNAPSHOTS', 5))
+
+# Chat admission control per worker (0 = no limit): concurrent turns, the point where turns run
+# degraded, how long a turn may wait for a slot, and per-user messages/second with burst
+app.config['CHAT_MAX_INFLIGHT'] = int(os.environ.get('CHAT_MAX_INFLIGHT', 8))
+app.config['CHAT_DEGRADE_AT'] = int(os.environ.get('CHAT_DEGRADE_AT', 6))
+app.config['CHAT_QUEUE_TIMEOUT'] = float(os.environ.get('CHAT_QUEUE_TIMEOUT', 2.0))
+app.config['CHAT_USER_RATE'] = float(os.environ.get('CHAT_USER_RATE', 1.0))
+app.config['CHAT_USER_BURST'] = float(os.environ.get('CHAT_USER_BURST', 10))
+
 CORS(app)
 
 # Initialize database
 db.init_app(app)
+router.init_app(app)
+metrics.registry.init_app(app)
+write_queue = WriteBehindQueue(db, app)
+stats_cache = TTLCache(ttl=app.config['ADMIN_STATS_TTL'])
+principal_cache = TTLCache(ttl=app.config['PRINCIPAL_CACHE_TTL'], max_size=4096)
+profile_store = ProfileStore(max_profiles=app.config['PROFILE_HISTORY'])
+memory_tracker = MemoryTracker()
+memory_tracker.init_app(app)
+admission = AdmissionController()
+admission.init_app(app)
+
+# Served to degraded and shed turns: recommendations by (emotion, mood) and replies to short messages
+recommendation_cache = TTLCache(ttl=600, max_size=64)
+reply_cache = TTLCache(ttl=600, max_size=1024)
 
 # Initialize components
 sentiment_analyzer = SentimentAnalyzer()
 dialogue_manager = DialogueManager()
 resource_recommender = ResourceRecommender()
 
+# What /api/admin/memory accounts separately
+memory_tracker.register('spacy', lambda: [dialogue_manager.nlp] if dialogue_manager.nlp is not None else [])
+memory_tracker.register('sentiment_models', lambda: [sentiment_analyzer])
+memory_tracker.register('dialogue_sessions', lambda: [dialogue_manager.sessions])
+memory_tracker.register('resources', lambda: [resource_recommender])
+memory_tracker.register('orm_instances', lambda: orm_instance_roots(db.Model))
+memory_tracker.register('caches', lambda: [stats_cache, principal_cache, profile_store, recommendation_cache, reply_cache])
+
 with app.app_context():
+    configure_engine(db.engine)
     db.create_all()
+    added_columns = upgrade_schema()
+    if added_columns:
+        print(f"✅ Added columns: {', '.join(added_columns)}")
+    if router.enabled:
+        router.create_schema(db.metadata)
+        shard_columns = set()
+        for engine in router.engines:
+            shard_columns.update(upgrade_schema(engine))
+        print(f"✅ Conversations sharded across {router.count} databases in {router.shard_dir}")
+        if 'archived_conversations.sentiments' in shard_columns:
+            print(f"✅ Backfilled sentiments for {backfill_archived_sentiments()} archived conversations")
+    else:
+        if 'conversations.message_count' in added_columns:
+            print(f"✅ Backfilled stats for {backfill_conversation_stats()} conversations")
+        if 'messages.user_id' in added_columns:
+            print(f"✅ Backfilled owners for {backfill_message_user_ids()} messages")
+        if 'archived_conversations.sentiments' in added_columns:
+            print(f"✅ Backfilled sentiments for {backfill_archived_sentiments()} archived conversations")
+    search_enabled = all([setup_message_search(engine) for engine in (router.engines or [db.engine])])
+    seed_stat_counters()
     
     # Create default admin 
     admin = User.query.filter_by(username='admin').first()
@@ -57,8 +193,334 @@ with app.app_context():
         admin.set_password('anj@123')  
         db.session.add(admin)
         db.session.commit()
+
+retention_scheduler = None
+if app.config['RETENTION_DAYS'] > 0 or app.config['ARCHIVE_AFTER_DAYS'] > 0 or app.config['LOG_RETENTION_DAYS'] > 0:
+    retention_scheduler = RetentionScheduler(
+        app,
+        days=app.config['RETENTION_DAYS'],
+        archive_days=app.config['ARCHIVE_AFTER_DAYS'],
+        log_days=app.config['LOG_RETENTION_DAYS'],
+        action=app.config['RETENTION_ACTION'],
+        archive_dir=app.config['RETENTION_ARCHIVE_DIR'],
+        batch_size=app.config['RETENTION_BATCH_SIZE'],
+        interval=app.config['RETENTION_INTERVAL_HOURS'] * 3600,
+        lock_path=app.config['RETENTION_LOCK_FILE']
+    )
        
 
+# ============= CLI COMMANDS =============
+
+@app.cli.command('backfill-conversation-stats')
+def backfill_conversation_stats_command():
+    """Recompute denormalized message_count / preview columns"""
+    updated = sum(backfill_conversation_stats() for _ in each_shard())
+    print(f"✅ Backfilled stats for {updated} conversations")
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recount users, conversations and messages into stat_counters"""
+    rebuild_stat_counters()
+    print(f"✅ Stat counters rebuilt: {get_stat_counters()}")
+
+@app.cli.command('export-conversations')
+@click.option('--output', '-o', required=True, help='File to write ("-" for stdout)')
+@click.option('--gzip', 'use_gzip', is_flag=True, help='gzip-compress the output')
+@click.option('--user-id', type=int, default=None, help="Only export this user's conversations")
+def export_conversations_command(output, use_gzip, user_id):
+    """Export conversations and messages as NDJSON"""
+    chunks = iter_ndjson(iter_export_records(user_id=user_id), gzip=use_gzip)
+    stream = click.get_binary_stream('stdout') if output == '-' else open(output, 'wb')
+    try:
+        for chunk in chunks:
+            stream.write(chunk)
+    finally:
+        if output != '-':
+            stream.close()
+    if output != '-':
+        print(f"✅ Exported conversations to {output}")
+
+@app.cli.command('purge-conversations')
+@click.option('--days', type=int, default=lambda: app.config['RETENTION_DAYS'] or None, required=True,
+              help='Remove conversations not updated for this many days (default RETENTION_DAYS)')
+@click.option('--action', type=click.Choice(RETENTION_ACTIONS), default=lambda: app.config['RETENTION_ACTION'])
+@click.option('--archive-dir', default=lambda: app.config['RETENTION_ARCHIVE_DIR'], help='Where archive mode writes NDJSON')
+@click.option('--batch-size', type=int, default=lambda: app.config['RETENTION_BATCH_SIZE'])
+@click.option('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+def purge_conversations_command(days, action, archive_dir, batch_size, pause):
+    """Apply the conversation retention policy once"""
+    conversations, messages = purge_expired_conversations(days, action, archive_dir, batch_size, pause)
+    print(f"✅ Removed {conversations} conversations ({messages} messages) older than {days} days")
+
+@app.cli.command('archive-conversations')
+@click.option('--days', type=int, default=lambda: app.config['ARCHIVE_AFTER_DAYS'] or None, required=True,
+              help='Archive conversations not updated for this many days (default ARCHIVE_AFTER_DAYS)')
+@click.option('--batch-size', type=int, default=200)
+@click.option('--log-days', type=int, default=lambda: app.config['LOG_RETENTION_DAYS'],
+              help='Also delete conversation_logs older than this many days (0 = keep)')
+@click.option('--vacuum', is_flag=True, help='VACUUM afterwards so SQLite returns the freed space')
+def archive_conversations_command(days, batch_size, log_days, vacuum):
+    """Move inactive conversations into compressed cold storage"""
+    conversations, messages = archive_inactive_conversations(days, batch_size)
+    print(f"✅ Archived {conversations} conversations ({messages} messages)")
+    if log_days:
+        print(f"✅ Deleted {prune_conversation_logs(log_days)} conversation log rows")
+    if vacuum and db.engine.dialect.name == 'sqlite':
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql('VACUUM')
+        print("✅ Database vacuumed")
+
+@app.cli.command('rebalance-shards')
+@click.option('--skip-main', is_flag=True, help='Leave conversations still on the main database alone')
+@click.option('--dry-run', is_flag=True, help='Only report how many users would move')
+def rebalance_shards_command(skip_main, dry_run):
+    """Move users' conversations to the shard they hash to (run with the app stopped)"""
+    users, conversations, messages = rebalance_shards(include_main=not skip_main, dry_run=dry_run)
+    if dry_run:
+        print(f"✅ {users} users would move")
+    else:
+        print(f"✅ Moved {users} users ({conversations} conversations, {messages} messages)")
+
+# ============= LIFECYCLE JOB =============
+
+@app.before_request
+def start_retention_scheduler():
+    """Start the lifecycle job in processes that serve requests, never in CLI commands"""
+    if retention_scheduler is not None:
+        retention_scheduler.start()
+
+# ============= SHARD ROUTING =============
+
+@app.before_request
+def select_shard():
+    """Route conversation queries to the shard of the conversation in the URL, else the signed-in user's"""
+    if not router.enabled:
+        return
+    
+    conversation_id = (request.view_args or {}).get('conversation_id')
+    if conversation_id is not None:
+        shard = router.shard_for_id(conversation_id)
+        if shard is None:
+            abort(404)
+    elif 'user_id' in session:
+        shard = router.shard_for_user(session['user_id'])
+    else:
+        return
+    
+    g.shard_scope = ExitStack()
+    g.shard_scope.enter_context(use_shard(shard))
+
+@app.teardown_request
+def release_shard(exc):
+    """Undo select_shard"""
+    scope = g.pop('shard_scope', None)
+    if scope is not None:
+        scope.close()
+
+# ============= METRICS =============
+
+@app.before_request
+def start_request_timer():
+    """Note when the request started"""
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    """Observe the request duration under its endpoint (streams: time until the response starts)"""
+    started = g.pop('request_started', None)
+    if started is not None and request.endpoint:
+        metrics.registry.observe(metrics.request_seconds, request.endpoint, time.perf_counter() - started)
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage and request latency histograms in Prometheus text format"""
+    token = app.config['METRICS_TOKEN']
+    if token and not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+# ============= PROFILING =============
+
+@app.before_request
+def start_profiling():
+    """Profile this request if an admin asked for it with X-Profile: 1 or ?profile=1"""
+    if request.headers.get('X-Profile') != '1' and request.args.get('profile') != '1':
+        return
+    if 'user_id' not in session:
+        return
+    user = current_principal()
+    if not user or not user.is_admin:
+        return
+    
+    g.profile_id = profile_store.next_id()
+    g.profile_info = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'user_id': user.id,
+        'started_at': get_ist_time().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    g.profiler = SamplingProfiler(
+        threading.get_ident(),
+        interval=app.config['PROFILE_SAMPLE_INTERVAL_MS'] / 1000,
+        max_seconds=app.config['PROFILE_MAX_SECONDS']
+    ).start()
+
+@app.after_request
+def attach_profile(response):
+    """Finish the profile once the response body has been sent (covers streamed responses)"""
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    
+    profile_id = g.pop('profile_id')
+    info = g.pop('profile_info')
+    response.headers['X-Profile-Id'] = profile_id
+    response.call_on_close(lambda: profile_store.add(profile_id, profiler.stop(), status=response.status_code, **info))
+    return response
+
+@app.teardown_request
+def abandon_profile(exc):
+    """Keep the profile of a request that failed before after_request ran"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profile_store.add(g.pop('profile_id'), profiler.stop(), status=500, **g.pop('profile_info'))
+
+# ============= ADMISSION CONTROL =============
+
+# Stand-in for analyze_with_spacy() on degraded turns
+SKIPPED_NLP_FEATURES = {'entities': [], 'noun_chunks': []}
+
+# Replies are only cached for short, generic messages ("hi", "thanks", ...)
+MAX_CACHED_REPLY_INPUT = 40
+
+OVERLOAD_MESSAGE = (
+    "I'm getting a lot of messages right now, so I can only send a short reply. "
+    "I'm still here for you - please send that again in a moment. 💙"
+)
+
+def admit_chat_turn(user_id, is_crisis):
+    """Admission ticket for this request's chat turn, released when the request ends
+
+    Crisis turns never wait for a slot or use up the user's rate limit.
+    """
+    if is_crisis:
+        ticket = admission.admit(user_id, timeout=0, limit_rate=False)
+    else:
+        ticket = admission.admit(user_id)
+    if ticket.rejected and is_crisis:
+        admission.count('crisis_bypass')
+    g.admission_ticket = ticket
+    return ticket
+
+@app.teardown_request
+def release_admission(exc):
+    """Give back the slot taken by admit_chat_turn (after a streamed response has finished)"""
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        ticket.release()
+
+def reply_cache_key(user_input):
+    """Normalized message for reply_cache, or None if it is too long to be generic"""
+    key = ' '.join(user_input.lower().split())
+    return key if len(key) <= MAX_CACHED_REPLY_INPUT else None
+
+def remember_reply(user_input, response_text, sentiment_data):
+    """Keep the reply to a short message for turns shed under load"""
+    key = reply_cache_key(user_input)
+    if key:
+        reply_cache.set(key, (response_text, sentiment_data['emotion']))
+
+def overload_reply(ticket, user_input, conversation_id):
+    """(status, payload) for a rate-limited or shed turn; the message is not saved"""
+    if ticket.level == 'limited':
+        return 429, {
+            'error': 'You are sending messages too quickly. Please wait a moment and try again.',
+            'retry_after': math.ceil(ticket.retry_after)
+        }
+    
+    key = reply_cache_key(user_input)
+    cached = reply_cache.get(key) if key else None
+    if cached is not None:
+        admission.count('cached_responses')
+        message, sentiment = cached
+    else:
+        message, sentiment = OVERLOAD_MESSAGE, 'neutral'
+    
+    # `shed` tells clients the message wasn't saved and should be sent again
+    return 200, {
+        'message': message,
+        'sentiment': sentiment,
+        'show_resources': False,
+        'conversation_id': conversation_id,
+        'degraded': True,
+        'shed': True
+    }
+
+def overload_response(ticket, status, payload, stream=False):
+    """Flask response for overload_reply(); `stream` sends a 200 reply as the SSE frames /api/chat/stream emits"""
+    if stream and status == 200:
+        meta = {key: payload[key] for key in ('conversation_id', 'show_resources', 'degraded', 'shed')}
+        return sse_response(iter([
+            sse_event('message', {'message': payload['message'], 'sentiment': payload['sentiment']}),
+            sse_event('meta', meta),
+            sse_event('done', {})
+        ]))
+    
+    response = jsonify(payload)
+    response.status_code = status
+    if status == 429:
+        response.headers['Retry-After'] = str(payload['retry_after'])
+    return response
+
+def recommend_for_turn(ticket, emotion, mood_preference):
+    """Resources for a turn; degraded turns reuse cached ones (None if nothing is cached)"""
+    key = (emotion, mood_preference)
+    if ticket.degraded:
+        return recommendation_cache.get(key)
+    resources = resource_recommender.recommend_resources(emotion, mood_preference)
+    recommendation_cache.set(key, resources)
+    return resources
+
+# ============= PRINCIPALS =============
+
+def load_principal(user_id):
+    """The fields authorization checks need for a user, or None if the user doesn't exist"""
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        generation = principal_cache.generation
+        row = db.session.execute(
+            db.select(User.id, User.username, User.is_admin).where(User.id == user_id)
+        ).first()
+        if row is None:
+            return None
+        principal = SimpleNamespace(id=row.id, username=row.username, is_admin=bool(row.is_admin))
+        principal_cache.set(user_id, principal, generation)
+    return principal
+
+def current_principal():
+    """The logged-in user's principal for this request (looked up at most once per request)"""
+    if 'principal' not in g:
+        g.principal = load_principal(session['user_id']) if 'user_id' in session else None
+    return g.principal
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def note_principal_change(mapper, connection, target):
+    """Remember users changed in this transaction; they are invalidated once it commits"""
+    object_session(target).info.setdefault('changed_principals', set()).add(target.id)
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_principals(session):
+    """Forget changed users only after commit, so no request re-caches the old row in between"""
+    for user_id in session.info.pop('changed_principals', ()):
+        principal_cache.invalidate(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_principal_changes(session):
+    session.info.pop('changed_principals', None)
+
 # ============= DECORATORS =============
 
 def login_required(f):
@@ -77,7 +539,7 @@ def admin_required(f):
         if 'user_id' not in session:
             return redirect(url_for('login'))
         
-        user = User.query.get(session['user_id'])
+        user = current_principal()
         if not user or not user.is_admin:
             return jsonify({'error': 'Admin access required'}), 403
         
@@ -198,7 +660,9 @@ def api_logout():
 @login_required
 def chat_page():
     """Main chat interface"""
-    user = User.query.get(session['user_id'])
+    user = current_principal()
+    if user is None:
+        return redirect(url_for('login'))
     return render_template('chat.html', user=user)
 
 @app.route('/api/chat', methods=['POST'])
@@ -215,30 +679,30 @@ def chat():
         
         user_id = session['user_id']
         
-        if conversation_id:
-            conversation = Conversation.query.get(conversation_id)
-            if not conversation or conversation.user_id != user_id:
-                return jsonify({'error': 'Invalid conversation'}), 403
-        else:
-            # Create new conversation
-            title = user_input[:50] + '...' if len(user_input) > 50 else user_input
-            conversation = Conversation(user_id=user_id, title=title)
-            db.session.add(conversation)
-            db.session.commit()
+        # Crisis detection runs whatever the load; everything else waits for admission
+        is_crisis = dialogue_manager.detect_crisis(user_input)
+        ticket = admit_chat_turn(user_id, is_crisis)
+        if ticket.rejected and not is_crisis:
+            status, payload = overload_reply(ticket, user_input, conversation_id)
+            return overload_response(ticket, status, payload)
+        
+        conversation = get_or_create_conversation(user_id, conversation_id, user_input)
+        if conversation is None:
+            return jsonify({'error': 'Invalid conversation'}), 403
         
         # Analyze sentiment
         sentiment_data = sentiment_analyzer.analyze_emotion(user_input)
         
         # Check for crisis
-        if dialogue_manager.detect_crisis(user_input):
+        if is_crisis:
             crisis_response = dialogue_manager.crisis_response()
             
             # Save messages
-            save_message(conversation.id, 'user', user_input, sentiment_data['emotion'])
-            save_message(conversation.id, 'bot', crisis_response['message'], 'crisis')
+            save_message(conversation, 'user', user_input, sentiment_data['emotion'], sentiment_data, is_crisis=True)
+            save_message(conversation, 'bot', crisis_response['message'], 'crisis')
             
-            # Legacy logging
-            log_conversation(str(user_id), user_input, 'crisis', crisis_response['message'])
+            # Save the turn, then the legacy log row
+            commit_turn(conversation, (str(user_id), user_input, 'crisis', crisis_response['message']))
             
             return jsonify({
                 'message': crisis_response['message'],
@@ -249,28 +713,29 @@ def chat():
                 'show_resources': False
             })
         
-        # Get bot response
+        # Get bot response (degraded turns skip the spacy parse)
         bot_response = dialogue_manager.manage_conversation(
             str(user_id),
             user_input,
-            sentiment_data
+            sentiment_data,
+            SKIPPED_NLP_FEATURES if ticket.degraded else None
         )
         
         # Save user message
-        save_message(conversation.id, 'user', user_input, sentiment_data['emotion'])
+        save_message(conversation, 'user', user_input, sentiment_data['emotion'], sentiment_data)
         
-        # Handle resource response
+        # Handle resource response (degraded turns only use cached recommendations)
+        resources = None
         if isinstance(bot_response, dict) and bot_response.get('trigger_resources'):
-            resources = resource_recommender.recommend_resources(
-                bot_response['emotion'],
-                data.get('mood_preference')
-            )
-            
+            resources = recommend_for_turn(ticket, bot_response['emotion'], data.get('mood_preference'))
+        
+        if resources is not None:
             # Save bot message
-            save_message(conversation.id, 'bot', bot_response['text'], sentiment_data['emotion'])
+            save_message(conversation, 'bot', bot_response['text'], sentiment_data['emotion'])
             
-            # Legacy logging
-            log_conversation(str(user_id), user_input[:100], sentiment_data['emotion'], bot_response['text'][:200])
+            # Save the turn, then the legacy log row
+            commit_turn(conversation, (str(user_id), user_input[:100], sentiment_data['emotion'], bot_response['text'][:200]))
+            remember_reply(user_input, bot_response['text'], sentiment_data)
             
             return jsonify({
                 'message': bot_response['text'],
@@ -278,24 +743,27 @@ def chat():
                 'sentiment': sentiment_data['emotion'],
                 'intensity': sentiment_data['intensity'],
                 'show_resources': True,
-                'conversation_id': conversation.id
+                'conversation_id': conversation.id,
+                'degraded': ticket.degraded
             })
         
         # Simple text response
         response_text = bot_response if isinstance(bot_response, str) else bot_response.get('text', str(bot_response))
         
         # Save bot message
-        save_message(conversation.id, 'bot', response_text, sentiment_data['emotion'])
+        save_message(conversation, 'bot', response_text, sentiment_data['emotion'])
         
-        # Legacy logging
-        log_conversation(str(user_id), user_input[:100], sentiment_data['emotion'], response_text[:200])
+        # Save the turn, then the legacy log row
+        commit_turn(conversation, (str(user_id), user_input[:100], sentiment_data['emotion'], response_text[:200]))
+        remember_reply(user_input, response_text, sentiment_data)
         
         return jsonify({
             'message': response_text,
             'sentiment': sentiment_data['emotion'],
             'intensity': sentiment_data['intensity'],
             'show_resources': False,
-            'conversation_id': conversation.id
+            'conversation_id': conversation.id,
+            'degraded': ticket.degraded
         })
         
     except Exception as e:
@@ -307,35 +775,220 @@ def chat():
             'show_resources': False
         }), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+@login_required
+def chat_stream():
+    """Handle chat messages as Server-Sent Events
+
+    Saves the turn as soon as the dialogue step returns (so a client that
+    disconnects mid-stream doesn't lose it), then emits the bot text,
+    resources and metadata.
+    """
+    data = request.json or {}
+    user_input = data.get('message', '').strip()
+    conversation_id = data.get('conversation_id')
+    
+    if not user_input:
+        return jsonify({'error': 'Empty message'}), 400
+    
+    user_id = session['user_id']
+    
+    # Crisis detection runs whatever the load; everything else waits for admission
+    is_crisis = dialogue_manager.detect_crisis(user_input)
+    ticket = admit_chat_turn(user_id, is_crisis)
+    if ticket.rejected and not is_crisis:
+        status, payload = overload_reply(ticket, user_input, conversation_id)
+        return overload_response(ticket, status, payload, stream=True)
+    
+    conversation = get_or_create_conversation(user_id, conversation_id, user_input)
+    if conversation is None:
+        return jsonify({'error': 'Invalid conversation'}), 403
+    
+    def generate():
+        try:
+            sentiment_data = sentiment_analyzer.analyze_emotion(user_input)
+            
+            # Check for crisis
+            if is_crisis:
+                crisis_response = dialogue_manager.crisis_response()
+                save_message(conversation, 'user', user_input, sentiment_data['emotion'], sentiment_data, is_crisis=True)
+                save_message(conversation, 'bot', crisis_response['message'], 'crisis')
+                commit_turn(conversation, (str(user_id), user_input, 'crisis', crisis_response['message']))
+                
+                yield sse_event('message', {
+                    'message': crisis_response['message'],
+                    'sentiment': 'negative',
+                    'is_crisis': True,
+                    'emergency_resources': crisis_response['emergency_resources']
+                })
+                yield sse_event('meta', {'conversation_id': conversation.id, 'show_resources': False, 'is_crisis': True})
+                yield sse_event('done', {})
+                return
+            
+            bot_response = dialogue_manager.manage_conversation(
+                str(user_id),
+                user_input,
+                sentiment_data,
+                SKIPPED_NLP_FEATURES if ticket.degraded else None
+            )
+            show_resources = isinstance(bot_response, dict) and bool(bot_response.get('trigger_resources'))
+            response_text = bot_response if isinstance(bot_response, str) else bot_response.get('text', str(bot_response))
+            
+            # Save before the first yield: a client that disconnects closes the generator there
+            save_message(conversation, 'user', user_input, sentiment_data['emotion'], sentiment_data)
+            save_message(conversation, 'bot', response_text, sentiment_data['emotion'])
+            commit_turn(conversation, (str(user_id), user_input[:100], sentiment_data['emotion'], response_text[:200]))
+            remember_reply(user_input, response_text, sentiment_data)
+            
+            # Bot text goes out before recommendations
+            yield sse_event('message', {
+                'message': response_text,
+                'sentiment': sentiment_data['emotion'],
+                'intensity': sentiment_data['intensity']
+            })
+            
+            if show_resources:
+                resources = recommend_for_turn(ticket, bot_response['emotion'], data.get('mood_preference'))
+                show_resources = resources is not None
+                if show_resources:
+                    yield sse_event('resources', {'resources': resources})
+            
+            yield sse_event('meta', {
+                'conversation_id': conversation.id,
+                'show_resources': show_resources,
+                'sentiment': sentiment_data['emotion'],
+                'intensity': sentiment_data['intensity'],
+                'degraded': ticket.degraded
+            })
+            yield sse_event('done', {})
+            
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            db.session.rollback()
+            yield sse_event('error', {'message': 'Sorry, I encountered an error. Please try again.'})
+    
+    return sse_response(stream_with_context(generate()))
+
 @app.route('/api/conversations', methods=['GET'])
 @login_required
 def get_conversations():
     """Get user's conversation history"""
     user_id = session['user_id']
-    conversations = Conversation.query.filter_by(user_id=user_id)\
-        .order_by(Conversation.updated_at.desc()).all()
+    conversations = db.session.execute(
+        db.select(*CONVERSATION_COLUMNS)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.updated_at.desc())
+    )
+    
+    return jsonify({
+        'conversations': rows_to_dicts(conversations)
+    })
+
+@app.route('/api/search', methods=['GET'])
+@login_required
+def search():
+    """Full-text search over message history
+
+    Query params:
+        q: search text (last word matches as a prefix)
+        page, per_page: paging (per_page max 20)
+        user_id: admins only, limit results to one user (default: all users)
+    
+    Archived conversations aren't indexed; `archived` counts the ones in scope
+    that were skipped (a new message in one restores it and makes it searchable).
+    """
+    if not search_enabled:
+        return jsonify({'error': 'Search is not available on this database'}), 501
+    
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search query'}), 400
+    
+    page = min(max(request.args.get('page', 1, type=int), 1), MAX_SEARCH_PAGE)
+    per_page = min(max(request.args.get('per_page', SEARCH_PAGE_SIZE, type=int), 1), SEARCH_PAGE_SIZE)
+    
+    # Users only ever search their own messages
+    current_user = current_principal()
+    user_id = session['user_id']
+    if current_user and current_user.is_admin:
+        user_id = request.args.get('user_id', type=int)
+    
+    with user_shard(user_id or session['user_id']):
+        results = search_messages(query, user_id=user_id, page=page, per_page=per_page)
+        archived = count_archived_conversations(user_id)
     
     return jsonify({
-        'conversations': [conv.to_dict() for conv in conversations]
+        'results': results,
+        'archived': archived,
+        'page': page,
+        'per_page': per_page,
+        'has_more': len(results) == per_page and page < MAX_SEARCH_PAGE
     })
 
 @app.route('/api/conversations/<int:conversation_id>', methods=['GET'])
 @login_required
 def get_conversation(conversation_id):
-    """Get specific conversation with messages"""
+    """Get a page of a conversation's messages, newest page first
+
+    Query params:
+        before: cursor from a previous page's next_cursor to load older messages
+        limit: page size (default 50, max 200)
+    """
     conversation = Conversation.query.get_or_404(conversation_id)
     
     # Check ownership (allow admin to view any conversation)
-    current_user = User.query.get(session['user_id'])
-    if conversation.user_id != session['user_id'] and not current_user.is_admin:
+    current_user = current_principal()
+    if conversation.user_id != session['user_id'] and not (current_user and current_user.is_admin):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    messages = Message.query.filter_by(conversation_id=conversation_id)\
-        .order_by(Message.timestamp.asc()).all()
+    limit = min(max(request.args.get('limit', MESSAGE_PAGE_SIZE, type=int), 1), MAX_MESSAGE_PAGE_SIZE)
+    
+    before = request.args.get('before')
+    if before:
+        try:
+            before_timestamp, before_id = decode_cursor(before)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    if conversation.archived_at:
+        # Cold storage: decompress the whole conversation and page in memory
+        messages = load_archived_messages(conversation_id)
+        if before:
+            messages = [m for m in messages if (m.timestamp, m.id) < (before_timestamp, before_id)]
+        has_more = len(messages) > limit
+        messages = messages[-limit:]
+        next_cursor = encode_cursor(messages[0].timestamp, messages[0].id) if has_more else None
+        messages = [msg.to_dict() for msg in messages]
+    else:
+        # The listed timestamp is cut to seconds; the cursor needs the stored value
+        query = db.select(*MESSAGE_COLUMNS, Message.timestamp.label('cursor_timestamp')).where(
+            Message.conversation_id == conversation_id
+        )
+        if before:
+            query = query.where(or_(
+                Message.timestamp < before_timestamp,
+                and_(Message.timestamp == before_timestamp, Message.id < before_id)
+            ))
+        
+        # Fetch one extra row to know whether an older page exists
+        rows = db.session.execute(
+            query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1)
+        ).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+        
+        next_cursor = encode_cursor(rows[0].cursor_timestamp, rows[0].id) if has_more else None
+        messages = rows_to_dicts(rows)
+        for message in messages:
+            del message['cursor_timestamp']
     
     return jsonify({
         'conversation': conversation.to_dict(),
-        'messages': [msg.to_dict() for msg in messages]
+        'messages': messages,
+        'has_more': has_more,
+        'next_cursor': next_cursor
     })
 
 @app.route('/api/conversations/<int:conversation_id>', methods=['DELETE'])
@@ -345,11 +998,11 @@ def delete_conversation(conversation_id):
     conversation = Conversation.query.get_or_404(conversation_id)
     
     # Check ownership (allow admin to delete any conversation)
-    current_user = User.query.get(session['user_id'])
-    if conversation.user_id != session['user_id'] and not current_user.is_admin:
+    current_user = current_principal()
+    if conversation.user_id != session['user_id'] and not (current_user and current_user.is_admin):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    db.session.delete(conversation)
+    delete_conversations([conversation_id])
     db.session.commit()
     
     print(f"✅ Conversation deleted: {conversation_id}")
@@ -376,90 +1029,440 @@ def admin_panel():
 @app.route('/api/admin/users', methods=['GET'])
 @admin_required
 def get_all_users():
-    """Get all users (admin only)"""
-    users = User.query.all()
+    """Get a page of users (admin only)
+
+    Query params: page, per_page, q (username/email prefix)
+    """
+    query = db.select(*USER_COLUMNS).order_by(User.id)
+    
+    search = request.args.get('q', '').strip()
+    if search:
+        query = query.where(or_(User.username.startswith(search), User.email.startswith(search)))
+    
+    page = paginate_rows(query, max_per_page=ADMIN_MAX_PAGE_SIZE)
+    
+    return jsonify({
+        'users': rows_to_dicts(page.items),
+        **pagination_meta(page)
+    })
+
+@app.route('/api/admin/users/<int:user_id>', methods=['GET'])
+@admin_required
+def get_user_summary(user_id):
+    """Get one user's profile and activity summary (admin only)"""
+    user = User.query.get_or_404(user_id)
+    
+    with user_shard(user_id):
+        totals = db.session.execute(
+            db.select(
+                func.count(Conversation.id),
+                func.coalesce(func.sum(Conversation.message_count), 0),
+                func.max(Conversation.updated_at)
+            ).where(Conversation.user_id == user_id)
+        ).one()
+    
     return jsonify({
-        'users': [user.to_dict() for user in users],
-        'total': len(users)
+        'user': user.to_dict(),
+        'total_conversations': totals[0],
+        'total_messages': totals[1],
+        'last_active': totals[2].strftime('%Y-%m-%d %H:%M:%S') if totals[2] else None
     })
 
+@app.route('/api/admin/users/<int:user_id>', methods=['DELETE'])
+@admin_required
+def delete_user_account(user_id):
+    """Delete a user and all their conversations (admin only)"""
+    user = User.query.get_or_404(user_id)
+    if user.id == session['user_id']:
+        return jsonify({'error': 'You cannot delete your own account'}), 400
+    
+    username = user.username
+    _, conversations, messages = delete_user(user_id)
+    db.session.commit()
+    stats_cache.invalidate()
+    # delete_user() deletes in bulk, so the after_delete hook doesn't see it
+    principal_cache.invalidate(user_id)
+    
+    print(f"✅ User deleted: {username} ({conversations} conversations, {messages} messages)")
+    
+    return jsonify({'message': 'User deleted', 'conversations': conversations, 'messages': messages})
+
 @app.route('/api/admin/conversations', methods=['GET'])
 @admin_required
 def get_all_conversations():
-    """Get all conversations (admin only)"""
-    conversations = Conversation.query.join(User).all()
+    """Get a page of conversations, most recently active first (admin only)
+
+    Query params:
+        page, per_page
+        user_id: only this user's conversations
+        start, end: updated_at range as YYYY-MM-DD (end inclusive)
+        sentiment: only conversations containing a message with this sentiment (archived ones included)
+    """
+    query = db.select(*CONVERSATION_COLUMNS, Conversation.user_id)
     
-    data = []
-    for conv in conversations:
-        conv_dict = conv.to_dict()
-        conv_dict['username'] = conv.user.username
-        conv_dict['user_email'] = conv.user.email
-        data.append(conv_dict)
+    user_id = request.args.get('user_id', type=int)
+    if user_id:
+        query = query.where(Conversation.user_id == user_id)
+    
+    try:
+        start = parse_date_arg('start')
+        end = parse_date_arg('end')
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    if start:
+        query = query.where(Conversation.updated_at >= start)
+    if end:
+        query = query.where(Conversation.updated_at < end + timedelta(days=1))
+    
+    sentiment = request.args.get('sentiment', '').strip()
+    if sentiment:
+        # Archived conversations have no rows in messages; their blob's sentiments are kept alongside it
+        query = query.where(or_(
+            db.select(Message.id)
+            .where(Message.conversation_id == Conversation.id, Message.sentiment == sentiment)
+            .exists(),
+            has_archived_sentiment(Conversation.id, sentiment)
+        ))
+    
+    query = query.order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+    if user_id or not router.enabled:
+        with user_shard(user_id or session['user_id']):
+            page = paginate_rows(query, max_per_page=ADMIN_MAX_PAGE_SIZE)
+    else:
+        page = paginate_across_shards(
+            query, key=lambda conv: (conv.updated_at or '', conv.id), max_per_page=ADMIN_MAX_PAGE_SIZE
+        )
+    
+    # Users live on the main database, so sharded rows can't be joined to them
+    data = rows_to_dicts(page.items)
+    owners = {
+        owner.id: owner for owner in db.session.execute(
+            db.select(User.id, User.username, User.email).where(User.id.in_({conv['user_id'] for conv in data}))
+        )
+    } if data else {}
+    for conv in data:
+        conv['username'] = owners[conv['user_id']].username
+        conv['user_email'] = owners[conv['user_id']].email
     
     return jsonify({
         'conversations': data,
-        'total': len(data)
+        **pagination_meta(page)
     })
 
 @app.route('/api/admin/stats', methods=['GET'])
 @admin_required
 def get_admin_stats():
     """Get system statistics (admin only)"""
-    total_users = User.query.count()
-    total_conversations = Conversation.query.count()
-    total_messages = Message.query.count()
+    data = stats_cache.get_or_set('admin_stats', build_admin_stats)
+    return jsonify({
+        **data,
+        'write_queue': write_queue.stats(),
+        'admission': admission.stats(),
+        'retention': retention_scheduler.stats() if retention_scheduler else None
+    })
+
+def build_admin_stats():
+    """Dashboard totals from stat_counters plus recent activity"""
+    counters = get_stat_counters()
     
     # Recent activity
-    recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
-    recent_conversations = Conversation.query.order_by(Conversation.updated_at.desc()).limit(10).all()
+    recent_users = db.session.execute(db.select(*USER_COLUMNS).order_by(User.created_at.desc()).limit(5))
+    recent_conversations = []
+    for _ in each_shard():
+        recent_conversations += rows_to_dicts(db.session.execute(
+            db.select(*CONVERSATION_COLUMNS).order_by(Conversation.updated_at.desc()).limit(10)
+        ))
+    recent_conversations.sort(key=lambda conv: conv['updated_at'] or '', reverse=True)
+    recent_conversations = recent_conversations[:10]
     
-    return jsonify({
+    return {
         'stats': {
-            'total_users': total_users,
-            'total_conversations': total_conversations,
-            'total_messages': total_messages,
+            'total_users': counters.get('total_users', 0),
+            'total_conversations': counters.get('total_conversations', 0),
+            'total_messages': counters.get('total_messages', 0),
         },
-        'recent_users': [u.to_dict() for u in recent_users],
-        'recent_conversations': [c.to_dict() for c in recent_conversations]
+        'recent_users': rows_to_dicts(recent_users),
+        'recent_conversations': recent_conversations,
+        'archive': archive_stats()
+    }
+
+@app.route('/api/admin/export', methods=['GET'])
+@admin_required
+def export_conversations():
+    """Stream conversations and messages as NDJSON (admin only)
+
+    Query params:
+        gzip: 1 to gzip the stream
+        user_id: only this user's conversations
+        start, end: updated_at range as YYYY-MM-DD (end inclusive)
+    """
+    try:
+        start = parse_date_arg('start')
+        end = parse_date_arg('end')
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    
+    use_gzip = request.args.get('gzip') in ('1', 'true')
+    records = iter_export_records(
+        user_id=request.args.get('user_id', type=int),
+        start=start,
+        end=end + timedelta(days=1) if end else None
+    )
+    
+    filename = f"mindmend-export-{get_ist_time().strftime('%Y%m%d-%H%M%S')}.ndjson" + ('.gz' if use_gzip else '')
+    response = Response(
+        stream_with_context(iter_ndjson(records, gzip=use_gzip)),
+        mimetype='application/gzip' if use_gzip else 'application/x-ndjson'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@app.route('/api/admin/trends', methods=['GET'])
+@admin_required
+def get_trends():
+    """Get pre-aggregated sentiment trends (admin only)
+
+    Query params:
+        granularity: 'day' (default) or 'hour'
+        start, end: YYYY-MM-DD (end inclusive); defaults to the last 30 days / 2 days
+        user_id: one user's trend instead of everyone's
+    """
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({'error': 'granularity must be day or hour'}), 400
+    
+    try:
+        start = parse_date_arg('start')
+        end = parse_date_arg('end')
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    
+    end = end + timedelta(days=1) if end else get_ist_time()
+    if not start:
+        start = end - (timedelta(days=30) if granularity == 'day' else timedelta(days=2))
+    
+    max_range = timedelta(days=366) if granularity == 'day' else timedelta(days=31)
+    if end - start > max_range:
+        return jsonify({'error': f'Range too large for {granularity} buckets'}), 400
+    
+    user_id = request.args.get('user_id', type=int)
+    
+    return jsonify({
+        'granularity': granularity,
+        'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+        'end': end.strftime('%Y-%m-%d %H:%M:%S'),
+        'user_id': user_id,
+        'buckets': get_sentiment_trends(granularity, start, end, user_id)
     })
 
+@app.route('/api/admin/profiles', methods=['GET'])
+@admin_required
+def get_profiles():
+    """List the request profiles kept by this worker (admin only)"""
+    return jsonify({'profiles': profile_store.summaries()})
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def get_profile(profile_id):
+    """One profile as collapsed stacks for flamegraph.pl / speedscope (admin only)"""
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        # Each worker keeps its own profiles; retry until the request lands on the one named in the id
+        return jsonify({'error': 'Profile not found on this worker'}), 404
+
+    response = Response(profile['profiler'].collapsed(), mimetype='text/plain')
+    response.headers['Content-Disposition'] = f'inline; filename="profile-{profile_id}.folded"'
+    return response
+
+@app.route('/api/admin/memory', methods=['GET'])
+@admin_required
+def get_memory_report():
+    """This worker's approximate memory use by component (admin only)
+
+    Query params: top (tracemalloc lines to list, default 10)
+    """
+    top = min(max(request.args.get('top', 10, type=int), 1), 100)
+    return jsonify(memory_tracker.report(top))
+
+@app.route('/api/admin/memory/snapshots', methods=['GET'])
+@admin_required
+def get_memory_snapshots():
+    """Memory snapshots kept by this worker (admin only)"""
+    return jsonify({'pid': os.getpid(), 'snapshots': memory_tracker.snapshots()})
+
+@app.route('/api/admin/memory/snapshots', methods=['POST'])
+@admin_required
+def take_memory_snapshot():
+    """Keep a memory snapshot to diff against later (admin only)"""
+    return jsonify({'pid': os.getpid(), 'snapshot': memory_tracker.take_snapshot()})
+
+@app.route('/api/admin/memory/diff', methods=['GET'])
+@admin_required
+def get_memory_diff():
+    """Memory growth between two snapshots (admin only)
+
+    Query params:
+        from: snapshot id
+        to: snapshot id (default: compare against now)
+        top: tracemalloc lines to list (default 10)
+    """
+    old = memory_tracker.get(request.args.get('from', type=int))
+    if old is None:
+        return jsonify({'error': 'Snapshot not found on this worker'}), 404
+    
+    if request.args.get('to'):
+        new = memory_tracker.get(request.args.get('to', type=int))
+        if new is None:
+            return jsonify({'error': 'Snapshot not found on this worker'}), 404
+    else:
+        new = memory_tracker.capture()
+    
+    top = min(max(request.args.get('top', 10, type=int), 1), 100)
+    return jsonify({'pid': os.getpid(), **memory_tracker.diff(old, new, top)})
+
 # ============= UTILITY FUNCTIONS =============
 
-def save_message(conversation_id, sender, content, sentiment=None):
-    """Save message to database"""
-    try:
-        message = Message(
-            conversation_id=conversation_id,
-            sender=sender,
-            content=content,
-            sentiment=sentiment
-        )
-        db.session.add(message)
-        
-        
+def get_or_create_conversation(user_id, conversation_id, user_input):
+    """Load the user's conversation, or stage a new one titled from the first message"""
+    if conversation_id:
         conversation = Conversation.query.get(conversation_id)
-        if conversation:
-            conversation.updated_at = get_ist_time()
-        
-        db.session.commit()
-    except Exception as e:
-       
-        db.session.rollback()
+        if not conversation or conversation.user_id != user_id:
+            return None
+        if conversation.archived_at:
+            # New activity brings an archived conversation back into the hot tables
+            restore_conversation(conversation)
+        return conversation
+    
+    title = user_input[:50] + '...' if len(user_input) > 50 else user_input
+    conversation = Conversation(user_id=user_id, title=title)
+    db.session.add(conversation)
+    return conversation
+
+def encode_cursor(timestamp, message_id):
+    """Opaque keyset cursor for a message position"""
+    raw = f"{timestamp.isoformat()}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor; raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, message_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+def pagination_meta(page):
+    """Paging fields shared by the admin list endpoints"""
+    return {
+        'total': page.total,
+        'page': page.page,
+        'per_page': page.per_page,
+        'pages': page.pages
+    }
+
+def paginate_rows(query, max_per_page):
+    """db.paginate() for a column projection, whose pages hold rows rather than ORM objects"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), max_per_page)
+    
+    total = db.session.execute(db.select(func.count()).select_from(query.order_by(None).subquery())).scalar()
+    items = db.session.execute(query.limit(per_page).offset((page - 1) * per_page)).all()
+    return SimpleNamespace(
+        items=items,
+        total=total,
+        page=page,
+        per_page=per_page,
+        pages=math.ceil(total / per_page) if total else 0
+    )
+
+def paginate_across_shards(query, key, max_per_page):
+    """paginate_rows() for a query over every shard, merging each shard's leading rows by `key` (descending)"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), max_per_page)
+    
+    items = []
+    total = 0
+    for _ in each_shard():
+        total += db.session.execute(db.select(func.count()).select_from(query.order_by(None).subquery())).scalar()
+        items += db.session.execute(query.limit(page * per_page)).all()
+    
+    items.sort(key=key, reverse=True)
+    return SimpleNamespace(
+        items=items[(page - 1) * per_page:page * per_page],
+        total=total,
+        page=page,
+        per_page=per_page,
+        pages=math.ceil(total / per_page) if total else 0
+    )
+
+def parse_date_arg(name):
+    """Parse a YYYY-MM-DD query param; None if absent, ValueError if malformed"""
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d')
+
+def sse_event(event, data):
+    """Format a Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    """Unbuffered text/event-stream response for an iterable of sse_event() frames"""
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def save_message(conversation, sender, content, sentiment=None, sentiment_data=None, is_crisis=False):
+    """Add a message to the current chat turn (written by commit_turn)
+
+    sentiment_data: full analyze_emotion result for user messages; its scores
+    are stored on the message and added to the sentiment trend buckets
+    """
+    message = Message(
+        conversation=conversation,
+        user_id=conversation.user_id,
+        sender=sender,
+        content=content,
+        sentiment=sentiment
+    )
+    db.session.add(message)
+    conversation.record_message(message)
+    
+    if sentiment_data is not None:
+        message.set_sentiment_scores(sentiment_data)
+        record_sentiment(conversation.user_id, sentiment_data, is_crisis)
+    
+    return message
 
 def log_conversation(user_id, message, sentiment, bot_response):
-    """Log conversation """
+    """Queue a legacy conversation log row for the background writer"""
+    return write_queue.enqueue(ConversationLog.__table__, {
+        'user_id': user_id,
+        'message': message,
+        'sentiment': sentiment,
+        'bot_response': bot_response[:200] if bot_response else '',
+        'timestamp': get_ist_time()
+    })
+
+def commit_turn(conversation, log_row=None):
+    """Write the conversation and messages of a chat turn in one transaction with a single conversation update
+
+    log_row: log_conversation() arguments, queued only once the turn is saved.
+    Rolls back and re-raises if the commit fails, so callers answer with an error.
+    """
     try:
-        log = ConversationLog(
-            user_id=user_id,
-            message=message,
-            sentiment=sentiment,
-            bot_response=bot_response[:200] if bot_response else ''
-        )
-        db.session.add(log)
-        db.session.commit()
+        conversation.updated_at = get_ist_time()
+        with timed('commit.turn'):
+            db.session.commit()
     except Exception as e:
-       
         db.session.rollback()
+        print(f"❌ Failed to save chat turn: {str(e)}")
+        raise
+    
+    if log_row is not None:
+        log_conversation(*log_row)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
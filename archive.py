@@ -0,0 +1,221 @@
+import json
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, update
+
+from models import db, Conversation, Message, ArchivedConversation, ConversationLog, get_ist_time
+from sharding import each_shard
+
+COMPRESSION_LEVEL = 9
+
+# Message columns kept in the archive blob (conversation_id is the blob's key)
+ARCHIVED_COLUMNS = [column.name for column in Message.__table__.columns if column.name != 'conversation_id']
+
+
+def pack_messages(rows):
+    """Compress a conversation's message rows into one blob"""
+    records = [
+        {name: (value.isoformat() if isinstance(value, datetime) else value) for name, value in row.items()}
+        for row in rows
+    ]
+    payload = json.dumps(records, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return zlib.compress(payload, COMPRESSION_LEVEL)
+
+
+def sentiment_tags(sentiments):
+    """Distinct non-empty sentiments in the ArchivedConversation.sentiments format"""
+    return ',' + ''.join(f'{sentiment},' for sentiment in sorted({s for s in sentiments if s}))
+
+
+def has_archived_sentiment(conversation_id, sentiment):
+    """EXISTS clause: the archived blob of `conversation_id` holds a message with `sentiment`"""
+    return (
+        select(ArchivedConversation.conversation_id)
+        .where(
+            ArchivedConversation.conversation_id == conversation_id,
+            ArchivedConversation.sentiments.contains(f',{sentiment},', autoescape=True)
+        )
+        .exists()
+    )
+
+
+def unpack_messages(archived):
+    """Decompress an ArchivedConversation back into message rows"""
+    if archived.compression != 'zlib':
+        raise ValueError(f'Unsupported archive compression: {archived.compression}')
+    records = json.loads(zlib.decompress(archived.data).decode('utf-8'))
+    for record in records:
+        if record.get('timestamp'):
+            record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+        record['conversation_id'] = archived.conversation_id
+    return records
+
+
+def load_archived_messages(conversation_id):
+    """An archived conversation's messages as detached Message objects, oldest first"""
+    archived = db.session.get(ArchivedConversation, conversation_id)
+    if archived is None:
+        return []
+    return [Message(**record) for record in unpack_messages(archived)]
+
+
+def archive_conversations(conversation_ids):
+    """Move the messages of the given conversations into compressed blobs
+
+    Runs in the caller's transaction; returns (conversations, messages) archived.
+    """
+    columns = [Message.__table__.c.conversation_id] + [Message.__table__.c[name] for name in ARCHIVED_COLUMNS]
+    rows = db.session.execute(
+        select(*columns)
+        .where(Message.conversation_id.in_(conversation_ids))
+        .order_by(Message.conversation_id, Message.timestamp, Message.id)
+    ).mappings().all()
+
+    by_conversation = {}
+    for row in rows:
+        by_conversation.setdefault(row['conversation_id'], []).append(
+            {name: row[name] for name in ARCHIVED_COLUMNS}
+        )
+    if not by_conversation:
+        return 0, 0
+
+    db.session.execute(insert(ArchivedConversation), [
+        {
+            'conversation_id': conversation_id,
+            'message_count': len(messages),
+            'compression': 'zlib',
+            'data': pack_messages(messages),
+            'archived_at': get_ist_time(),
+            'sentiments': sentiment_tags(message['sentiment'] for message in messages)
+        }
+        for conversation_id, messages in by_conversation.items()
+    ])
+    db.session.execute(
+        delete(Message).where(Message.conversation_id.in_(list(by_conversation))),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        update(Conversation)
+        .where(Conversation.id.in_(list(by_conversation)))
+        .values(archived_at=get_ist_time(), updated_at=Conversation.updated_at),
+        execution_options={'synchronize_session': False}
+    )
+    return len(by_conversation), len(rows)
+
+
+def restore_conversation(conversation):
+    """Move an archived conversation's messages back into the messages table (caller commits)"""
+    archived = db.session.get(ArchivedConversation, conversation.id)
+    if archived is not None:
+        records = unpack_messages(archived)
+        if records:
+            db.session.execute(insert(Message), records)
+        db.session.delete(archived)
+    conversation.archived_at = None
+
+
+def archive_inactive_conversations(days, batch_size=200, pause=0.0):
+    """Archive conversations not updated for more than `days` days, one short transaction per batch"""
+    total_conversations = 0
+    total_messages = 0
+    for _ in each_shard():
+        conversations, messages = _archive_inactive(days, batch_size, pause)
+        total_conversations += conversations
+        total_messages += messages
+    return total_conversations, total_messages
+
+
+def _archive_inactive(days, batch_size, pause):
+    """archive_inactive_conversations for the currently selected database"""
+    cutoff = get_ist_time() - timedelta(days=days)
+    total_conversations = 0
+    total_messages = 0
+
+    while True:
+        ids = db.session.execute(
+            select(Conversation.id)
+            .where(
+                Conversation.updated_at < cutoff,
+                Conversation.archived_at.is_(None),
+                Conversation.message_count > 0
+            )
+            .order_by(Conversation.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+
+        try:
+            conversations, messages = archive_conversations(ids)
+            # Anything left unarchived had a stale message_count and no messages
+            db.session.execute(
+                update(Conversation)
+                .where(Conversation.id.in_(ids), Conversation.archived_at.is_(None))
+                .values(message_count=0, updated_at=Conversation.updated_at),
+                execution_options={'synchronize_session': False}
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        total_conversations += conversations
+        total_messages += messages
+        if pause:
+            time.sleep(pause)
+
+    return total_conversations, total_messages
+
+
+def backfill_archived_sentiments(batch_size=200):
+    """Fill ArchivedConversation.sentiments for conversations archived before the column existed"""
+    total = 0
+    for _ in each_shard():
+        while True:
+            rows = db.session.execute(
+                select(ArchivedConversation).where(ArchivedConversation.sentiments.is_(None)).limit(batch_size)
+            ).scalars().all()
+            if not rows:
+                break
+            for archived in rows:
+                archived.sentiments = sentiment_tags(record.get('sentiment') for record in unpack_messages(archived))
+            db.session.commit()
+            total += len(rows)
+    return total
+
+
+def prune_conversation_logs(days, batch_size=5000):
+    """Delete legacy conversation_logs rows older than `days` days in batches"""
+    cutoff = get_ist_time() - timedelta(days=days)
+    total = 0
+
+    while True:
+        ids = db.session.execute(
+            select(ConversationLog.id).where(ConversationLog.timestamp < cutoff).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.session.execute(delete(ConversationLog).where(ConversationLog.id.in_(ids)))
+        db.session.commit()
+        total += len(ids)
+
+    return total
+
+
+def archive_stats():
+    """Archived conversation and message totals and compressed bytes stored"""
+    stats = {'conversations': 0, 'messages': 0, 'stored_bytes': 0}
+    for _ in each_shard():
+        count, messages, stored = db.session.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(ArchivedConversation.message_count), 0),
+                func.coalesce(func.sum(func.length(ArchivedConversation.data)), 0)
+            ).select_from(ArchivedConversation)
+        ).one()
+        stats['conversations'] += count
+        stats['messages'] += messages
+        stats['stored_bytes'] += stored
+    return stats
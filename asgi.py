@@ -0,0 +1,310 @@
+"""
+ASGI entry point
+
+POST /api/chat is served natively on the event loop: the CPU-heavy NLP
+steps run in a thread pool so one worker can hold many conversations at
+once, and independent steps (sentiment + spacy, recommendations + saving
+the turn) run concurrently. Every other route is handed to the Flask app
+through asgiref's WSGI adapter.
+
+The native handler doesn't run Flask's request hooks, so it does their
+work itself: it picks the user's shard around each database step, records
+the request under the 'chat' endpoint in the latency metrics and starts
+the retention scheduler. Profiled requests (X-Profile: 1 or ?profile=1)
+go through Flask instead, since the sampling profiler follows one thread
+and the native turn hops between executor threads.
+
+Run with:
+    uvicorn asgi:application --workers 2
+    gunicorn asgi:application -k uvicorn.workers.UvicornWorker
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+
+import metrics
+from sharding import user_shard
+from app import (
+    app, db, Conversation, sentiment_analyzer, dialogue_manager, write_queue, admission,
+    get_or_create_conversation, save_message, commit_turn,
+    SKIPPED_NLP_FEATURES, overload_reply, recommend_for_turn, remember_reply, start_retention_scheduler
+)
+
+executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('NLP_EXECUTOR_WORKERS', 4)),
+    thread_name_prefix='nlp'
+)
+# Turns waiting up to CHAT_QUEUE_TIMEOUT for an admission slot block one of these threads, not the event loop
+admission_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('ADMISSION_WAIT_THREADS', 64)),
+    thread_name_prefix='admission'
+)
+wsgi_application = WsgiToAsgi(app)
+
+
+async def run_in_executor(func, *args):
+    """Run a blocking call on the NLP thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
+
+def load_session(scope):
+    """Decode the signed Flask session cookie from the request headers"""
+    cookie_header = b''
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookie_header = value
+            break
+
+    try:
+        cookie = SimpleCookie()
+        cookie.load(cookie_header.decode('latin-1'))
+    except CookieError:
+        return {}
+
+    session_cookie = cookie.get(app.config['SESSION_COOKIE_NAME'])
+    if session_cookie is None:
+        return {}
+
+    serializer = app.session_interface.get_signing_serializer(app)
+    if serializer is None:
+        return {}
+
+    try:
+        max_age = int(app.permanent_session_lifetime.total_seconds())
+        return serializer.loads(session_cookie.value, max_age=max_age)
+    except BadSignature:
+        return {}
+
+
+async def read_body(receive):
+    """Read the full request body"""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def wants_profile(scope):
+    """Whether the request asks for profiling, which only the Flask request hooks provide"""
+    headers = dict(scope.get('headers', []))
+    if headers.get(b'x-profile') == b'1':
+        return True
+    return parse_qs(scope.get('query_string', b'').decode('latin-1')).get('profile') == ['1']
+
+
+async def send_json(send, payload, status=200):
+    """Send a JSON response (with Retry-After when the payload carries retry_after)"""
+    body = json.dumps(payload).encode('utf-8')
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode('ascii'))
+    ]
+    if payload.get('retry_after') is not None:
+        headers.append((b'retry-after', str(payload['retry_after']).encode('ascii')))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': headers
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_redirect(send, location):
+    """Send a redirect (mirrors login_required for anonymous users)"""
+    await send({
+        'type': 'http.response.start',
+        'status': 302,
+        'headers': [(b'location', location.encode('ascii')), (b'content-length', b'0')]
+    })
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def owns_conversation(user_id, conversation_id):
+    """Check conversation ownership"""
+    with app.app_context(), user_shard(user_id):
+        conversation = db.session.get(Conversation, conversation_id)
+        return conversation is not None and conversation.user_id == user_id
+
+
+def persist_turn(user_id, conversation_id, user_input, messages, log_row):
+    """Save a chat turn in one transaction and return the conversation id"""
+    with app.app_context(), user_shard(user_id):
+        conversation = get_or_create_conversation(user_id, conversation_id, user_input)
+        for message_args in messages:
+            save_message(conversation, *message_args)
+        commit_turn(conversation, log_row)
+        return conversation.id
+
+
+async def admit_turn(user_id, is_crisis):
+    """Admission ticket for a turn, waiting for a slot like the WSGI path but off the event loop
+
+    Crisis turns never wait or use up the user's rate limit.
+    """
+    if is_crisis:
+        return admission.admit(user_id, timeout=0, limit_rate=False)
+
+    pending = admission_executor.submit(admission.admit, user_id)
+    try:
+        return await asyncio.wrap_future(pending)
+    except asyncio.CancelledError:
+        # The client went away while queued: release the slot once the wait ends
+        pending.add_done_callback(lambda done: done.cancelled() or done.result().release())
+        raise
+
+
+async def chat_turn(user_id, data):
+    """Async version of the /api/chat pipeline; returns (status, payload)"""
+    user_input = (data.get('message') or '').strip()
+    conversation_id = data.get('conversation_id')
+
+    if not user_input:
+        return 400, {'error': 'Empty message'}
+
+    # Crisis detection runs whatever the load; everything else waits for admission
+    is_crisis = dialogue_manager.detect_crisis(user_input)
+    ticket = await admit_turn(user_id, is_crisis)
+    if ticket.rejected:
+        if not is_crisis:
+            return overload_reply(ticket, user_input, conversation_id)
+        admission.count('crisis_bypass')
+
+    with ticket:
+        return await admitted_chat_turn(user_id, data, user_input, conversation_id, is_crisis, ticket)
+
+
+async def admitted_chat_turn(user_id, data, user_input, conversation_id, is_crisis, ticket):
+    """chat_turn once admission control let the turn through"""
+    if conversation_id and not await run_in_executor(owns_conversation, user_id, conversation_id):
+        return 403, {'error': 'Invalid conversation'}
+
+    # Sentiment and spacy don't depend on each other; degraded turns skip spacy
+    if ticket.degraded:
+        sentiment_data = await run_in_executor(sentiment_analyzer.analyze_emotion, user_input)
+        nlp_features = SKIPPED_NLP_FEATURES
+    else:
+        sentiment_data, nlp_features = await asyncio.gather(
+            run_in_executor(sentiment_analyzer.analyze_emotion, user_input),
+            run_in_executor(dialogue_manager.analyze_with_spacy, user_input)
+        )
+
+    # Check for crisis
+    if is_crisis:
+        crisis_response = dialogue_manager.crisis_response()
+        conversation_id = await run_in_executor(
+            persist_turn, user_id, conversation_id, user_input,
+            [('user', user_input, sentiment_data['emotion'], sentiment_data, True), ('bot', crisis_response['message'], 'crisis')],
+            (str(user_id), user_input, 'crisis', crisis_response['message'])
+        )
+        return 200, {
+            'message': crisis_response['message'],
+            'sentiment': 'negative',
+            'is_crisis': True,
+            'emergency_resources': crisis_response['emergency_resources'],
+            'conversation_id': conversation_id,
+            'show_resources': False
+        }
+
+    bot_response = await run_in_executor(
+        dialogue_manager.manage_conversation, str(user_id), user_input, sentiment_data, nlp_features
+    )
+    response_text = bot_response if isinstance(bot_response, str) else bot_response.get('text', str(bot_response))
+
+    save = run_in_executor(
+        persist_turn, user_id, conversation_id, user_input,
+        [('user', user_input, sentiment_data['emotion'], sentiment_data), ('bot', response_text, sentiment_data['emotion'])],
+        (str(user_id), user_input[:100], sentiment_data['emotion'], response_text[:200])
+    )
+
+    # Recommendations and saving the turn overlap
+    resources = None
+    if isinstance(bot_response, dict) and bot_response.get('trigger_resources'):
+        resources, conversation_id = await asyncio.gather(
+            run_in_executor(recommend_for_turn, ticket, bot_response['emotion'], data.get('mood_preference')),
+            save
+        )
+    else:
+        conversation_id = await save
+    remember_reply(user_input, response_text, sentiment_data)
+
+    if resources is not None:
+        return 200, {
+            'message': response_text,
+            'resources': resources,
+            'sentiment': sentiment_data['emotion'],
+            'intensity': sentiment_data['intensity'],
+            'show_resources': True,
+            'conversation_id': conversation_id,
+            'degraded': ticket.degraded
+        }
+
+    return 200, {
+        'message': response_text,
+        'sentiment': sentiment_data['emotion'],
+        'intensity': sentiment_data['intensity'],
+        'show_resources': False,
+        'conversation_id': conversation_id,
+        'degraded': ticket.degraded
+    }
+
+
+async def handle_chat(scope, receive, send):
+    """Native async handler for POST /api/chat"""
+    session = load_session(scope)
+    if 'user_id' not in session:
+        await send_redirect(send, '/login')
+        return
+
+    start_retention_scheduler()
+    started = time.perf_counter()
+    try:
+        data = json.loads(await read_body(receive) or b'{}')
+        status, payload = await chat_turn(session['user_id'], data)
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        status, payload = 500, {
+            'message': 'Sorry, I encountered an error. Please try again.',
+            'sentiment': 'neutral',
+            'show_resources': False
+        }
+
+    metrics.registry.observe(metrics.request_seconds, 'chat', time.perf_counter() - started)
+    await send_json(send, payload, status)
+
+
+async def handle_lifespan(receive, send):
+    """Drain background work when the server shuts down"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            write_queue.shutdown()
+            admission_executor.shutdown(wait=True)
+            executor.shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI application"""
+    if scope['type'] == 'lifespan':
+        await handle_lifespan(receive, send)
+        return
+
+    if scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/api/chat' and not wants_profile(scope):
+        await handle_chat(scope, receive, send)
+        return
+
+    await wsgi_application(scope, receive, send)
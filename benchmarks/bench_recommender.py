@@ -0,0 +1,185 @@
+"""
+Benchmark for ResourceRecommender
+
+Builds synthetic resource catalogs of increasing size and measures per-call
+latency, memory and allocations for find_best_resources_sklearn and
+recommend_resources, plus how stable the returned ranking is across
+repeated calls with the same input.
+
+Usage:
+    python benchmarks/bench_recommender.py
+    python benchmarks/bench_recommender.py --sizes 10,100,1000 --queries 50
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resource_recommender import ResourceRecommender  # noqa: E402
+
+
+VIDEO_TYPES = ['meditation', 'calming', 'relaxation', 'funny', 'motivational', 'educational', 'energetic']
+
+CONTEXT_WORDS = [
+    'anxiety', 'stress', 'exam', 'sleep', 'breathing', 'calm', 'relax', 'meditation',
+    'motivation', 'funny', 'anger', 'healing', 'positive', 'energy', 'mindfulness',
+    'resilience', 'panic', 'focus', 'work', 'lonely', 'music', 'yoga', 'gratitude'
+]
+
+
+def build_catalog(size, seed=42):
+    """Build a synthetic catalog with `size` videos per emotion"""
+    rng = random.Random(seed)
+    catalog = {}
+
+    for emotion in ('negative', 'positive', 'neutral'):
+        videos = []
+        for i in range(size):
+            words = rng.sample(CONTEXT_WORDS, 4)
+            videos.append({
+                'title': f"{' '.join(words[:2]).title()} Session {i}",
+                'url': f'https://example.com/{emotion}/{i}',
+                'type': rng.choice(VIDEO_TYPES),
+                'duration': f'{rng.randint(1, 60)} min',
+                'description': f"Guided {words[2]} practice for {words[3]}"
+            })
+        catalog[emotion] = {
+            'videos': videos,
+            'exercises': [{'name': f'Exercise {i}', 'description': 'Synthetic exercise'} for i in range(8)],
+            'articles': [{'title': f'Article {i}', 'url': f'https://example.com/a/{i}'} for i in range(4)],
+            'professional_resources': [{'name': f'Service {i}'} for i in range(5)]
+        }
+
+    return catalog
+
+
+def build_queries(count, seed=7):
+    """Generate user_context queries"""
+    rng = random.Random(seed)
+    return [' '.join(rng.sample(CONTEXT_WORDS, rng.randint(2, 6))) for _ in range(count)]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def top_urls(result):
+    """Extract the ranked video urls from either recommender output"""
+    videos = result.get('videos', []) if isinstance(result, dict) else result
+    return [v['url'] for v in videos]
+
+
+def ranking_stability(first, second):
+    """Jaccard overlap and position agreement of two rankings"""
+    if not first and not second:
+        return 1.0, 1.0
+    a, b = set(first), set(second)
+    jaccard = len(a & b) / len(a | b)
+    same_position = sum(1 for x, y in zip(first, second) if x == y)
+    return jaccard, same_position / max(len(first), len(second))
+
+
+def run_scenario(name, call, queries):
+    """Time `call(query)` for every query and collect memory/stability stats"""
+    # Warm up so one-off imports and caches don't skew the first sample
+    call(queries[0])
+
+    latencies = []
+    peaks = []
+    blocks = []
+    jaccards = []
+    positions = []
+
+    for query in queries:
+        blocks_before = sys.getallocatedblocks()
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = call(query)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        blocks_after = sys.getallocatedblocks()
+
+        # Latency is measured again without tracemalloc, which slows allocation-heavy code
+        start = time.perf_counter()
+        repeat = call(query)
+        latencies.append(min(elapsed, time.perf_counter() - start))
+        peaks.append(peak)
+        blocks.append(max(0, blocks_after - blocks_before))
+
+        jaccard, position = ranking_stability(top_urls(result), top_urls(repeat))
+        jaccards.append(jaccard)
+        positions.append(position)
+
+    return {
+        'scenario': name,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'peak_kb': statistics.mean(peaks) / 1024,
+        'blocks': statistics.mean(blocks),
+        'jaccard': statistics.mean(jaccards),
+        'position': statistics.mean(positions)
+    }
+
+
+def run(sizes, query_count, emotion, mood_preference):
+    """Run all scenarios for every catalog size"""
+    recommender = ResourceRecommender()
+    queries = build_queries(query_count)
+    rows = []
+
+    for size in sizes:
+        recommender.resources = build_catalog(size)
+        scenarios = [
+            ('sklearn_match', lambda q: recommender.find_best_resources_sklearn(emotion, q)),
+            ('recommend_no_context', lambda q: recommender.recommend_resources(emotion)),
+            ('recommend_context', lambda q: recommender.recommend_resources(emotion, user_context=q)),
+            ('recommend_mood', lambda q: recommender.recommend_resources(emotion, mood_preference, q)),
+        ]
+        for name, call in scenarios:
+            row = run_scenario(name, call, queries)
+            row['size'] = size
+            rows.append(row)
+
+    return rows
+
+
+def print_report(rows):
+    """Print results as a fixed-width table"""
+    header = f"{'size':>6}  {'scenario':<22}{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'peak KB':>10}{'blocks':>9}{'jaccard':>9}{'pos':>7}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(
+            f"{row['size']:>6}  {row['scenario']:<22}"
+            f"{row['mean_ms']:>9.3f}{row['p50_ms']:>9.3f}{row['p95_ms']:>9.3f}"
+            f"{row['peak_kb']:>10.1f}{row['blocks']:>9.0f}"
+            f"{row['jaccard']:>9.2f}{row['position']:>7.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ResourceRecommender')
+    parser.add_argument('--sizes', default='10,100,1000,5000', help='Comma separated videos per emotion')
+    parser.add_argument('--queries', type=int, default=30, help='Number of user_context queries per scenario')
+    parser.add_argument('--emotion', default='negative')
+    parser.add_argument('--mood', default='meditation', help='mood_preference used by the recommend_mood scenario')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    random.seed(0)
+
+    print_report(run(sizes, args.queries, args.emotion, args.mood))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,382 @@
+"""
+Load test for the whole app with simulated concurrent chat users
+
+Signs up N synthetic users, then each one logs in and works through
+multi-turn chat scripts (with think time between turns), reloads its
+conversation list and history, while admin users poll the dashboard
+endpoints. Reports throughput, latency percentiles and outcomes per
+endpoint: errors, and separately the chat turns that admission control
+answered degraded, shed (a stand-in reply, message not saved) or rate
+limited (429).
+
+The per-user chat rate limit (CHAT_USER_RATE) would otherwise dominate a
+load run: pass --user-rate 0 to turn it off in-process, or start the
+server with CHAT_USER_RATE=0.
+
+Runs against a live server or in-process through the Flask test client
+(which uses the database configured by DATABASE_URL, so point that at a
+scratch database).
+
+Usage:
+    gunicorn -w 4 app:app &
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --users 50 --duration 60
+
+    DATABASE_URL=sqlite:////tmp/loadtest.db python benchmarks/loadtest.py --users 10 --think 0 --user-rate 0
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+OUTCOMES = ('ok', 'degraded', 'shed', 'limited', 'error')
+
+
+# Multi-turn conversations; each user picks scripts at random
+CHAT_SCRIPTS = [
+    [
+        "Hi there",
+        "I've been feeling really anxious about my exams",
+        "I can't sleep and I keep worrying that I'll fail",
+        "Maybe some breathing exercises would help",
+        "Thank you, that helps a bit"
+    ],
+    [
+        "Hello",
+        "I feel lonely lately, my friends don't call me anymore",
+        "I moved to a new city for work and I don't know anyone",
+        "I guess I could try joining a club",
+        "Thanks for listening"
+    ],
+    [
+        "Hey",
+        "Work has been so stressful, my manager keeps piling on tasks",
+        "I'm exhausted and I feel like I'm failing at everything",
+        "I want to feel calmer in the evenings",
+        "Okay, I'll try that tonight. Bye"
+    ],
+    [
+        "Good morning!",
+        "I'm actually feeling great today, I got the job!",
+        "I want to keep this positive energy going",
+        "Any ideas to stay motivated?",
+        "Awesome, thanks!"
+    ]
+]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class HttpTransport:
+    """One user's HTTP client against a running server, with its own cookie jar"""
+
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, method, path, payload=None):
+        """Return (status, parsed JSON body or None)"""
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                return response.status, _parse(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, _parse(e.read())
+
+
+class FlaskTransport:
+    """One user's Flask test client, for running without a server"""
+
+    app = None
+
+    def __init__(self):
+        if FlaskTransport.app is None:
+            from app import app
+            FlaskTransport.app = app
+        self.client = FlaskTransport.app.test_client()
+
+    def request(self, method, path, payload=None):
+        response = self.client.open(path, method=method, json=payload)
+        try:
+            return response.status_code, _parse(response.get_data())
+        finally:
+            response.close()
+
+
+def _parse(body):
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+def outcome(status, body, ok_statuses):
+    """Classify a response as one of OUTCOMES"""
+    if status == 429:
+        return 'limited'
+    if status not in ok_statuses:
+        return 'error'
+    if isinstance(body, dict) and body.get('shed'):
+        return 'shed'
+    if isinstance(body, dict) and body.get('degraded'):
+        return 'degraded'
+    return 'ok'
+
+
+class Recorder:
+    """Thread-safe latency and outcome samples per endpoint"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, seconds, result):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((seconds, result))
+
+
+class VirtualUser:
+    """Signs up, logs in and chats through scripts until told to stop"""
+
+    def __init__(self, transport, recorder, username, password, think, rng):
+        self.transport = transport
+        self.recorder = recorder
+        self.username = username
+        self.password = password
+        self.think = think
+        self.rng = rng
+        self.user_id = None
+
+    def call(self, method, path, payload=None, endpoint=None, ok_statuses=(200, 201)):
+        """Make a timed request and record it under `endpoint` (default "METHOD path" without the query)"""
+        start = time.perf_counter()
+        try:
+            status, body = self.transport.request(method, path, payload)
+        except Exception:
+            status, body = 0, None
+        endpoint = endpoint or f"{method} {path.split('?')[0]}"
+        self.recorder.add(endpoint, time.perf_counter() - start, outcome(status, body, ok_statuses))
+        return status, body
+
+    def pause(self):
+        """Think time: uniform around the configured mean"""
+        if self.think > 0:
+            time.sleep(self.rng.uniform(0.5 * self.think, 1.5 * self.think))
+
+    def signup(self):
+        status, body = self.call('POST', '/api/auth/signup', {
+            'username': self.username,
+            'email': f'{self.username}@loadtest.invalid',
+            'password': self.password
+        })
+        if status == 201:
+            self.user_id = body['user']['id']
+        return status == 201
+
+    def login(self):
+        status, _ = self.call('POST', '/api/auth/login', {'username': self.username, 'password': self.password})
+        return status == 200
+
+    def run(self, stop):
+        """Chat through random scripts until `stop` is set"""
+        if not self.login():
+            return
+        while not stop.is_set():
+            conversation_id = None
+            for message in self.rng.choice(CHAT_SCRIPTS):
+                if stop.is_set():
+                    return
+                payload = {'message': message}
+                if conversation_id:
+                    payload['conversation_id'] = conversation_id
+                status, body = self.call('POST', '/api/chat', payload)
+                if status == 200 and body:
+                    conversation_id = body.get('conversation_id') or conversation_id
+                self.pause()
+
+            self.call('GET', '/api/conversations')
+            if conversation_id:
+                self.call('GET', f'/api/conversations/{conversation_id}', endpoint='GET /api/conversations/<id>')
+            self.pause()
+
+
+class AdminUser(VirtualUser):
+    """Polls the admin dashboard endpoints"""
+
+    def run(self, stop):
+        if not self.login():
+            print(f"❌ Admin login failed for {self.username}")
+            return
+        while not stop.is_set():
+            self.call('GET', '/api/admin/stats')
+            self.call('GET', '/api/admin/users?per_page=20')
+            self.call('GET', '/api/admin/conversations?per_page=20')
+            self.pause()
+
+
+def run(make_transport, users, admins, admin_username, admin_password, duration, think, ramp_up, seed):
+    """Sign users up, run them for `duration` seconds and return (recorder, elapsed, signup ids)"""
+    rng = random.Random(seed)
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+
+    virtual_users = []
+    for i in range(users):
+        user = VirtualUser(make_transport(), recorder, f'lt_{run_id}_{i}', 'loadtest-pass', think,
+                           random.Random(rng.random()))
+        if user.signup():
+            virtual_users.append(user)
+    print(f"✅ Signed up {len(virtual_users)}/{users} users")
+
+    virtual_users += [
+        AdminUser(make_transport(), recorder, admin_username, admin_password, think, random.Random(rng.random()))
+        for _ in range(admins)
+    ]
+
+    stop = threading.Event()
+    threads = []
+    start = time.perf_counter()
+    for index, user in enumerate(virtual_users):
+        thread = threading.Thread(target=user.run, args=(stop,), daemon=True)
+        thread.start()
+        threads.append(thread)
+        if ramp_up and index < len(virtual_users) - 1:
+            time.sleep(ramp_up / len(virtual_users))
+
+    stop.wait(max(0, duration - (time.perf_counter() - start)))
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return recorder, elapsed, [user.user_id for user in virtual_users if user.user_id]
+
+
+def summarize(recorder, elapsed):
+    """Per-endpoint rows plus a total row"""
+    rows = []
+    everything = []
+    for endpoint, samples in sorted(recorder.samples.items()):
+        everything += samples
+        rows.append(_row(endpoint, samples, elapsed))
+    if everything:
+        rows.append(_row('TOTAL', everything, elapsed))
+    return rows
+
+
+def _row(endpoint, samples, elapsed):
+    latencies = [seconds for seconds, _ in samples]
+    counts = {name: sum(1 for _, result in samples if result == name) for name in OUTCOMES}
+    return {
+        'endpoint': endpoint,
+        'requests': len(samples),
+        'errors': counts['error'],
+        'error_pct': 100.0 * counts['error'] / len(samples),
+        'degraded': counts['degraded'],
+        'shed': counts['shed'],
+        'shed_pct': 100.0 * counts['shed'] / len(samples),
+        'limited': counts['limited'],
+        'limited_pct': 100.0 * counts['limited'] / len(samples),
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000
+    }
+
+
+def print_report(rows, elapsed):
+    """Print results as a fixed-width table"""
+    header = (f"{'endpoint':<34}{'reqs':>7}{'err%':>7}{'degr':>6}{'shed%':>7}{'429%':>7}{'req/s':>8}"
+              f"{'mean ms':>9}{'p50':>8}{'p90':>8}{'p95':>8}{'p99':>8}{'max':>9}")
+    print(f"\nRan for {elapsed:.1f}s")
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(
+            f"{row['endpoint']:<34}{row['requests']:>7}{row['error_pct']:>7.1f}{row['degraded']:>6}"
+            f"{row['shed_pct']:>7.1f}{row['limited_pct']:>7.1f}{row['rps']:>8.1f}"
+            f"{row['mean_ms']:>9.1f}{row['p50_ms']:>8.1f}{row['p90_ms']:>8.1f}{row['p95_ms']:>8.1f}"
+            f"{row['p99_ms']:>8.1f}{row['max_ms']:>9.1f}"
+        )
+
+
+def cleanup(make_transport, admin_username, admin_password, user_ids):
+    """Delete the synthetic users (and their conversations) through the admin API"""
+    admin = VirtualUser(make_transport(), Recorder(), admin_username, admin_password, 0, random.Random())
+    if not admin.login():
+        print("❌ Cleanup skipped: admin login failed")
+        return
+    deleted = sum(
+        1 for user_id in user_ids
+        if admin.call('DELETE', f'/api/admin/users/{user_id}')[0] == 200
+    )
+    print(f"✅ Deleted {deleted}/{len(user_ids)} synthetic users")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test MindMend with concurrent simulated users')
+    parser.add_argument('--url', help='Base URL of a running server (default: in-process Flask test client)')
+    parser.add_argument('--users', type=int, default=10, help='Concurrent chat users')
+    parser.add_argument('--admins', type=int, default=1, help='Concurrent admin dashboard users')
+    parser.add_argument('--admin-username', default='admin')
+    parser.add_argument('--admin-password', default=os.environ.get('LOADTEST_ADMIN_PASSWORD', 'anj@123'))
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run after signup')
+    parser.add_argument('--think', type=float, default=1.0, help='Mean think time between actions, in seconds')
+    parser.add_argument('--ramp-up', type=float, default=0, help='Seconds over which to start the users')
+    parser.add_argument('--user-rate', type=float,
+                        help='Per-user chat messages/second for in-process runs (0 = no limit; default: app config)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+    parser.add_argument('--cleanup', action='store_true', help='Delete the synthetic users afterwards')
+    args = parser.parse_args()
+
+    if args.url:
+        if args.user_rate is not None:
+            parser.error('--user-rate only applies in-process; start the server with CHAT_USER_RATE instead')
+        make_transport = lambda: HttpTransport(args.url)  # noqa: E731
+    else:
+        if args.user_rate is not None:
+            # Read by app.py at import, which FlaskTransport does lazily
+            os.environ['CHAT_USER_RATE'] = str(args.user_rate)
+        make_transport = FlaskTransport
+
+    recorder, elapsed, user_ids = run(
+        make_transport, args.users, args.admins, args.admin_username, args.admin_password,
+        args.duration, args.think, args.ramp_up, args.seed
+    )
+    rows = summarize(recorder, elapsed)
+    print_report(rows, elapsed)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'elapsed': elapsed, 'users': args.users, 'think': args.think, 'endpoints': rows}, f, indent=2)
+
+    if args.cleanup:
+        cleanup(make_transport, args.admin_username, args.admin_password, user_ids)
+
+
+if __name__ == '__main__':
+    main()
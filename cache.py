@@ -0,0 +1,70 @@
+import threading
+import time
+
+
+class TTLCache:
+    """Small thread-safe per-process cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, ttl=5.0, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Bumped by every invalidate(), see set(generation=...)
+        self.generation = 0
+
+    def get(self, key, default=None):
+        """Return a cached value, or `default` if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._data.pop(key, None)
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, generation=None):
+        """Cache a value for `ttl` seconds
+
+        Pass the `generation` read before loading the value to skip caching it
+        if an invalidation happened meanwhile (the value may predate it).
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if len(self._data) >= self.max_size and key not in self._data:
+                self._evict()
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def get_or_set(self, key, factory):
+        """Return the cached value or compute, cache and return factory()"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None"""
+        with self._lock:
+            self.generation += 1
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def _evict(self):
+        """Drop expired entries, then the oldest ones if still full (caller holds the lock)"""
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._data.items() if expires < now]:
+            del self._data[key]
+        while len(self._data) >= self.max_size:
+            del self._data[next(iter(self._data))]
+
+    def stats(self):
+        """Size and hit/miss counters"""
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,75 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URL = 'sqlite:///mindmend.db'
+
+# SQLite connection pragmas, overridable from the environment
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 20000))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+# Connection pool, per worker process
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+
+
+def get_database_url():
+    """Database URL from DATABASE_URL, defaulting to the local SQLite file"""
+    url = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    # Some hosts still hand out the old postgres:// scheme
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite(url):
+    """Whether a database URL points at SQLite"""
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def engine_options(url):
+    """SQLAlchemy create_engine() options for a database URL
+
+    In-memory SQLite uses a single shared connection, so pool sizing only
+    applies to file databases and database servers.
+    """
+    parsed = make_url(url)
+    if is_sqlite(url) and parsed.database in (None, '', ':memory:'):
+        return {}
+
+    options = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT
+    }
+    if not is_sqlite(url):
+        # Drop connections the server (or a proxy) closed while idle
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = DB_POOL_RECYCLE
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the SQLite pragmas to a new connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA journal_mode={SQLITE_JOURNAL_MODE}')
+    cursor.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+    cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.close()
+
+
+def configure_engine(engine):
+    """Install per-connection setup on an engine (SQLite pragmas); no-op for other databases"""
+    if engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', set_sqlite_pragmas):
+        event.listen(engine, 'connect', set_sqlite_pragmas)
+    return engine
+
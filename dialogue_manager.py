@@ -3,6 +3,8 @@ import re
 from datetime import datetime
 import spacy  # ===== ADD: Spacy for NLP =====
 
+from metrics import timed
+
 
 class DialogueManager:
    
@@ -257,10 +259,29 @@ class DialogueManager:
             return noun_chunks
         except:
             return []
+    
+    @timed('spacy')
+    def analyze_with_spacy(self, user_input):
+        """Entities and noun chunks from a single spacy parse"""
+        try:
+            if self.nlp is None:
+                return {'entities': [], 'noun_chunks': []}
+            
+            doc = self.nlp(user_input)
+            return {
+                'entities': [{'text': ent.text, 'label': ent.label_} for ent in doc.ents],
+                'noun_chunks': [chunk.text for chunk in doc.noun_chunks]
+            }
+        except:
+            return {'entities': [], 'noun_chunks': []}
     # ===== END: Spacy extraction =====
     
-    def manage_conversation(self, user_id, user_input, sentiment_data):
-        """Main conversation management"""
+    def manage_conversation(self, user_id, user_input, sentiment_data, nlp_features=None):
+        """Main conversation management
+
+        nlp_features: optional precomputed result of analyze_with_spacy, so
+        callers can run the spacy parse concurrently with sentiment analysis
+        """
         
         # Initialize session
         if user_id not in self.sessions:
@@ -284,8 +305,10 @@ class DialogueManager:
         text_lower = user_input.lower()
         
         # ===== ADD: Extract spacy entities =====
-        entities = self.extract_entities_with_spacy(user_input)
-        noun_chunks = self.extract_noun_chunks_with_spacy(user_input)
+        if nlp_features is None:
+            nlp_features = self.analyze_with_spacy(user_input)
+        entities = nlp_features['entities']
+        noun_chunks = nlp_features['noun_chunks']
         # ===== END: Spacy extraction =====
         
         # Detect all matching intents
@@ -302,6 +325,7 @@ class DialogueManager:
         
         return response
     
+    @timed('intents')
     def _detect_all_intents(self, text):
         """Detect all matching intents"""
         detected = []
@@ -310,6 +334,7 @@ class DialogueManager:
                 detected.append(intent)
         return detected if detected else ['general']
     
+    @timed('response')
     def _generate_smart_response(self, session, intents, sentiment_data, text_lower):
         """Generate intelligent contextual responses"""
         
@@ -508,6 +533,7 @@ class DialogueManager:
             'specific_type': specific_type
         }
     
+    @timed('crisis')
     def detect_crisis(self, text):
         """Detect crisis keywords"""
         text_lower = text.lower()
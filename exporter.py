@@ -0,0 +1,134 @@
+import json
+import zlib
+
+from sqlalchemy import select
+
+from models import db, User, Conversation, Message
+from archive import load_archived_messages
+from sharding import each_shard, user_shard
+
+CONVERSATIONS_PER_CHUNK = 200
+ROWS_PER_FETCH = 1000
+WRITE_BUFFER_SIZE = 64 * 1024
+
+
+def _fmt(timestamp):
+    return timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else None
+
+
+def message_record(message_id, conversation_id, sender, content, sentiment, intensity, timestamp):
+    """Export record for one message"""
+    return {
+        'type': 'message',
+        'id': message_id,
+        'conversation_id': conversation_id,
+        'sender': sender,
+        'content': content,
+        'sentiment': sentiment,
+        'intensity': intensity,
+        'timestamp': _fmt(timestamp)
+    }
+
+
+def iter_export_records(user_id=None, start=None, end=None, conversation_ids=None):
+    """Yield conversation and message dicts in conversation order (per shard when sharded)
+
+    Conversations are read in keyset chunks and each chunk is streamed from a
+    server-side cursor (yield_per), so memory stays flat and no single read
+    transaction stays open for the whole export. Usernames are looked up per
+    chunk because users live on the main database, not the shards.
+    """
+    shards = [user_shard(user_id)] if user_id else each_shard()
+    for _ in shards:
+        yield from _iter_shard_records(user_id, start, end, conversation_ids)
+
+
+def _iter_shard_records(user_id, start, end, conversation_ids):
+    """iter_export_records for the currently selected database"""
+    last_id = 0
+
+    while True:
+        chunk = select(Conversation.id, Conversation.user_id).where(Conversation.id > last_id)
+        if conversation_ids is not None:
+            chunk = chunk.where(Conversation.id.in_(conversation_ids))
+        if user_id:
+            chunk = chunk.where(Conversation.user_id == user_id)
+        if start:
+            chunk = chunk.where(Conversation.updated_at >= start)
+        if end:
+            chunk = chunk.where(Conversation.updated_at < end)
+        chunk = db.session.execute(chunk.order_by(Conversation.id).limit(CONVERSATIONS_PER_CHUNK)).all()
+        if not chunk:
+            break
+
+        chunk_ids = [row.id for row in chunk]
+        usernames = dict(db.session.execute(
+            select(User.id, User.username).where(User.id.in_({row.user_id for row in chunk}))
+        ).all())
+
+        query = (
+            select(
+                Conversation.id, Conversation.user_id, Conversation.title,
+                Conversation.created_at, Conversation.updated_at, Conversation.message_count, Conversation.archived_at,
+                Message.id, Message.sender, Message.content, Message.sentiment, Message.intensity, Message.timestamp
+            )
+            .where(Conversation.id.in_(chunk_ids))
+            .outerjoin(Message, Message.conversation_id == Conversation.id)
+            .order_by(Conversation.id, Message.timestamp, Message.id)
+            .execution_options(yield_per=ROWS_PER_FETCH)
+        )
+
+        current_id = None
+        for row in db.session.execute(query):
+            (conversation_id, conv_user_id, title, created_at, updated_at, message_count, archived_at,
+             message_id, sender, content, sentiment, intensity, timestamp) = row
+
+            if conversation_id != current_id:
+                current_id = conversation_id
+                yield {
+                    'type': 'conversation',
+                    'id': conversation_id,
+                    'user_id': conv_user_id,
+                    'username': usernames.get(conv_user_id),
+                    'title': title,
+                    'created_at': _fmt(created_at),
+                    'updated_at': _fmt(updated_at),
+                    'message_count': message_count
+                }
+                if archived_at is not None:
+                    for message in load_archived_messages(conversation_id):
+                        yield message_record(message.id, conversation_id, message.sender, message.content,
+                                             message.sentiment, message.intensity, message.timestamp)
+
+            if message_id is not None:
+                yield message_record(message_id, conversation_id, sender, content, sentiment, intensity, timestamp)
+
+        # End the chunk's read transaction before starting the next one
+        db.session.rollback()
+        last_id = chunk_ids[-1]
+
+
+def iter_ndjson(records, gzip=False):
+    """Encode records as NDJSON byte chunks, optionally gzip-compressed"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    buffer = []
+    size = 0
+
+    for record in records:
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        buffer.append(line)
+        size += len(line)
+
+        if size >= WRITE_BUFFER_SIZE:
+            data = b''.join(buffer)
+            buffer, size = [], 0
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+
+    data = b''.join(buffer)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
@@ -0,0 +1,15 @@
+"""
+gunicorn settings picked up automatically from the working directory
+
+Command-line flags (e.g. from the Procfile) still override anything set here.
+"""
+import os
+
+
+def on_starting(server):
+    """Drop metric files left by the previous run's workers before new ones start"""
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir:
+        from metrics import registry
+        registry.metrics_dir = metrics_dir
+        registry.clear_worker_files()
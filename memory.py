@@ -0,0 +1,226 @@
+"""
+Approximate per-component memory accounting for a worker
+
+Two views, both per worker process:
+
+- Object walks: the bytes reachable from each registered component's roots
+  (spaCy pipeline, sentiment models, dialogue sessions, ...), following
+  gc.get_referents() and counting shared objects once per component.
+  Memory held inside C extensions without Python objects (parts of spaCy's
+  vocab, BLAS buffers) is invisible to this walk.
+- tracemalloc: live allocations grouped by the package or module that made
+  them. Only available when the worker started with MEMORY_TRACE_FRAMES > 0,
+  since tracing slows every allocation down.
+
+Snapshots of both can be kept and diffed later to spot growth.
+"""
+import gc
+import itertools
+import os
+import sys
+import threading
+import tracemalloc
+import types
+from collections import OrderedDict
+
+from models import get_ist_time
+
+# Walks don't descend into these: they are shared process-wide, not owned by a component
+STOP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.CodeType)
+
+# Cap per component so one walk can't stall the worker
+MAX_WALK_OBJECTS = 2000000
+
+# tracemalloc grouping: top-level package directories -> component
+PACKAGE_COMPONENTS = {
+    'spacy': 'spacy', 'thinc': 'spacy', 'srsly': 'spacy', 'cymem': 'spacy', 'preshed': 'spacy', 'blis': 'spacy',
+    'sklearn': 'sklearn', 'scipy': 'sklearn', 'numpy': 'sklearn', 'joblib': 'sklearn',
+    'vaderSentiment': 'sentiment', 'textblob': 'sentiment', 'nltk': 'sentiment',
+    'sqlalchemy': 'sqlalchemy',
+    'flask': 'flask', 'werkzeug': 'flask', 'jinja2': 'flask'
+}
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def deep_size(roots, max_objects=MAX_WALK_OBJECTS):
+    """(bytes, objects, truncated) for everything reachable from `roots`"""
+    seen = set()
+    stack = list(roots)
+    size = 0
+    while stack:
+        if len(seen) >= max_objects:
+            return size, len(seen), True
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, STOP_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj, 0)
+        stack.extend(gc.get_referents(obj))
+    return size, len(seen), False
+
+
+def orm_instance_roots(model_base):
+    """Attribute dicts of every live ORM instance, skipping the mapper state they all share"""
+    return [
+        {key: value for key, value in obj.__dict__.items() if key != '_sa_instance_state'}
+        for obj in gc.get_objects() if isinstance(obj, model_base)
+    ]
+
+
+def component_for(filename):
+    """Component a tracemalloc frame's file belongs to"""
+    parts = filename.split(os.sep)
+    for part in reversed(parts[:-1]):
+        if part in PACKAGE_COMPONENTS:
+            return PACKAGE_COMPONENTS[part]
+    if filename.startswith(APP_ROOT + os.sep) and os.sep not in filename[len(APP_ROOT) + 1:]:
+        return os.path.splitext(parts[-1])[0]
+    return 'other'
+
+
+def current_rss():
+    """Resident set size in bytes, or None where /proc isn't available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _take_traces():
+    """tracemalloc snapshot without the tracer's own and the import machinery's allocations"""
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        tracemalloc.Filter(False, '<unknown>')
+    ))
+
+
+def _by_component(statistics, attribute='size'):
+    """Sum tracemalloc 'filename' statistics (or diffs) per component"""
+    totals = {}
+    for stat in statistics:
+        name = component_for(stat.traceback[0].filename)
+        totals[name] = totals.get(name, 0) + getattr(stat, attribute)
+    return dict(sorted(totals.items(), key=lambda item: -abs(item[1])))
+
+
+def _location(stat):
+    frame = stat.traceback[0]
+    return f'{os.path.relpath(frame.filename, APP_ROOT) if frame.filename.startswith(APP_ROOT) else frame.filename}:{frame.lineno}'
+
+
+class MemoryTracker:
+    """Registered components plus a bounded set of snapshots to diff"""
+
+    def __init__(self, max_snapshots=5):
+        self.max_snapshots = max_snapshots
+        self.components = OrderedDict()
+        self._snapshots = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Start tracemalloc when MEMORY_TRACE_FRAMES is set"""
+        self.max_snapshots = app.config.get('MEMORY_SNAPSHOTS', self.max_snapshots)
+        frames = app.config.get('MEMORY_TRACE_FRAMES', 0)
+        if frames > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def register(self, name, roots):
+        """Account `roots()` (an iterable of objects, evaluated on each report) as component `name`"""
+        self.components[name] = roots
+
+    def component_sizes(self):
+        """{component: {'bytes', 'objects', 'truncated'}} from object walks"""
+        sizes = {}
+        for name, roots in self.components.items():
+            size, objects, truncated = deep_size(roots())
+            sizes[name] = {'bytes': size, 'objects': objects, 'truncated': truncated}
+        return sizes
+
+    def report(self, top=10):
+        """Current RSS, component sizes, gc state and (when tracing) allocations by component"""
+        report = {
+            'pid': os.getpid(),
+            'rss_bytes': current_rss(),
+            'components': self.component_sizes(),
+            'gc': {'counts': gc.get_count(), 'objects': len(gc.get_objects())},
+            'tracemalloc': None
+        }
+        if tracemalloc.is_tracing():
+            traces = _take_traces()
+            current, peak = tracemalloc.get_traced_memory()
+            report['tracemalloc'] = {
+                'current_bytes': current,
+                'peak_bytes': peak,
+                'by_component': _by_component(traces.statistics('filename')),
+                'top': [
+                    {'location': _location(stat), 'bytes': stat.size, 'count': stat.count}
+                    for stat in traces.statistics('lineno')[:top]
+                ]
+            }
+        return report
+
+    def capture(self):
+        """Component sizes, RSS and (when tracing) a tracemalloc snapshot, without storing them"""
+        return {
+            'id': 'now',
+            'taken_at': get_ist_time().strftime('%Y-%m-%d %H:%M:%S'),
+            'rss_bytes': current_rss(),
+            'components': self.component_sizes(),
+            'traces': _take_traces() if tracemalloc.is_tracing() else None
+        }
+
+    def take_snapshot(self):
+        """capture() and keep the result for later diffs, dropping the oldest beyond max_snapshots"""
+        snapshot = self.capture()
+        snapshot['id'] = next(self._ids)
+        with self._lock:
+            self._snapshots[snapshot['id']] = snapshot
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return self._summary(snapshot)
+
+    def _summary(self, snapshot):
+        return {
+            'id': snapshot['id'],
+            'taken_at': snapshot['taken_at'],
+            'rss_bytes': snapshot['rss_bytes'],
+            'traced': snapshot['traces'] is not None
+        }
+
+    def snapshots(self):
+        with self._lock:
+            return [self._summary(snapshot) for snapshot in self._snapshots.values()]
+
+    def get(self, snapshot_id):
+        with self._lock:
+            return self._snapshots.get(snapshot_id)
+
+    def diff(self, old, new, top=10):
+        """Growth from snapshot `old` to snapshot `new` (by component and, if both were traced, by line)"""
+        diff = {
+            'from': old['id'],
+            'to': new['id'],
+            'rss_bytes': (new['rss_bytes'] - old['rss_bytes']) if None not in (old['rss_bytes'], new['rss_bytes']) else None,
+            'components': {
+                name: {
+                    'bytes': size['bytes'] - old['components'].get(name, {}).get('bytes', 0),
+                    'objects': size['objects'] - old['components'].get(name, {}).get('objects', 0)
+                }
+                for name, size in new['components'].items()
+            },
+            'tracemalloc': None
+        }
+        if old['traces'] is not None and new['traces'] is not None:
+            diff['tracemalloc'] = {
+                'by_component': _by_component(new['traces'].compare_to(old['traces'], 'filename'), 'size_diff'),
+                'top': [
+                    {'location': _location(stat), 'bytes': stat.size_diff, 'count': stat.count_diff}
+                    for stat in new['traces'].compare_to(old['traces'], 'lineno')[:top]
+                ]
+            }
+        return diff
@@ -0,0 +1,205 @@
+"""
+In-process latency histograms served in Prometheus text format at /metrics
+
+Each worker records into its own histograms (a bisect and a few additions
+under a lock per observation). With METRICS_DIR set, workers also dump their
+totals to METRICS_DIR/worker_<pid>.json every METRICS_FLUSH_INTERVAL seconds,
+and /metrics sums every worker's file, so one scrape covers all gunicorn
+workers. Files of exited workers are kept so counters never go backwards;
+gunicorn.conf.py clears the directory when the master starts.
+
+Stages are recorded with timed(), as a block or around every call:
+
+    with timed('crisis'):
+        ...
+
+    @timed('spacy')
+    def analyze_with_spacy(...):
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+# Upper bounds in seconds; NLP stages sit in the low milliseconds, commits can spike to seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+WORKER_FILE_PREFIX = 'worker_'
+
+
+class Histogram:
+    """Latency histogram with one label; keeps per-bucket (non-cumulative) counts"""
+
+    def __init__(self, name, documentation, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        """Record one duration"""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def snapshot(self):
+        """{label value: {'counts', 'sum', 'count'}} copied under the lock"""
+        with self._lock:
+            return {
+                value: {'counts': list(counts), 'sum': total, 'count': count}
+                for value, (counts, total, count) in self._series.items()
+            }
+
+
+class MetricsRegistry:
+    """The process's histograms plus the optional cross-worker file aggregation"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.metrics_dir = None
+        self.flush_interval = 5.0
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+
+    def init_app(self, app):
+        """Read METRICS_DIR / METRICS_FLUSH_INTERVAL from app config"""
+        self.metrics_dir = app.config.get('METRICS_DIR') or None
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', self.flush_interval)
+        if self.metrics_dir:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+
+    def histogram(self, name, documentation, label, buckets=DEFAULT_BUCKETS):
+        """Register (or return the already registered) histogram `name`"""
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, documentation, label, buckets)
+        return self.histograms[name]
+
+    def observe(self, histogram, label_value, seconds):
+        """Record a duration and flush this worker's file when it is due"""
+        histogram.observe(label_value, seconds)
+        if self.metrics_dir and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _worker_path(self, pid=None):
+        return os.path.join(self.metrics_dir, f'{WORKER_FILE_PREFIX}{pid or os.getpid()}.json')
+
+    def flush(self):
+        """Write this worker's totals to METRICS_DIR (atomically, via rename)"""
+        if not self.metrics_dir or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_flush = time.monotonic()
+            path = self._worker_path()
+            payload = {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+            with open(path + '.tmp', 'w') as f:
+                json.dump(payload, f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"❌ Failed to write metrics: {str(e)}")
+        finally:
+            self._flush_lock.release()
+
+    def clear_worker_files(self):
+        """Remove every worker file (called once when the server starts)"""
+        if not self.metrics_dir or not os.path.isdir(self.metrics_dir):
+            return
+        for name in os.listdir(self.metrics_dir):
+            if name.startswith(WORKER_FILE_PREFIX):
+                os.remove(os.path.join(self.metrics_dir, name))
+
+    def collect(self):
+        """{histogram name: {label value: series}} summed over every worker"""
+        if not self.metrics_dir:
+            return {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+
+        self.flush()
+        merged = {}
+        for name in sorted(os.listdir(self.metrics_dir)):
+            if not (name.startswith(WORKER_FILE_PREFIX) and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.metrics_dir, name)) as f:
+                    worker = json.load(f)
+            except (OSError, ValueError):
+                continue  # Worker is mid-write or the file vanished
+            for metric, series in worker.items():
+                target = merged.setdefault(metric, {})
+                for value, data in series.items():
+                    if value not in target:
+                        target[value] = {'counts': list(data['counts']), 'sum': data['sum'], 'count': data['count']}
+                    else:
+                        total = target[value]
+                        total['counts'] = [a + b for a, b in zip(total['counts'], data['counts'])]
+                        total['sum'] += data['sum']
+                        total['count'] += data['count']
+        return merged
+
+    def render(self):
+        """Prometheus text exposition (format 0.0.4) of all histograms"""
+        collected = self.collect()
+        lines = []
+        for name, histogram in self.histograms.items():
+            lines.append(f'# HELP {name} {histogram.documentation}')
+            lines.append(f'# TYPE {name} histogram')
+            for value, data in sorted(collected.get(name, {}).items()):
+                label = f'{histogram.label}="{escape_label(value)}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, data['counts']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{label},le="+Inf"}} {data["count"]}')
+                lines.append(f'{name}_sum{{{label}}} {data["sum"]}')
+                lines.append(f'{name}_count{{{label}}} {data["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    """Escape a label value for the text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    'mindmend_stage_seconds', 'Time spent in each chat pipeline stage', 'stage'
+)
+request_seconds = registry.histogram(
+    'mindmend_request_seconds', 'Request handling time by Flask endpoint', 'endpoint'
+)
+
+
+class timed:
+    """Record the duration of a block (context manager) or of every call (decorator) as `stage`"""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe(stage_seconds, self.stage, time.perf_counter() - self._start)
+        return False
+
+    def __call__(self, func):
+        stage = self.stage
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                registry.observe(stage_seconds, stage, time.perf_counter() - start)
+        return wrapper
@@ -1,8 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import String, cast, delete, event, func, insert, inspect, select, text, update
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+from sharding import ShardedSession, each_shard_of, user_shard
+
+db = SQLAlchemy(session_options={'class_': ShardedSession})
 
 
 def get_ist_time():
@@ -13,6 +16,13 @@ def get_ist_time():
     return ist_time
 
 
+def make_preview(content, length=50):
+    """Shorten message content for conversation list previews"""
+    if not content:
+        return ''
+    return content[:length] + '...' if len(content) > length else content
+
+
 class User(db.Model):
     """User account model"""
     __tablename__ = 'users'
@@ -22,11 +32,12 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(200), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=get_ist_time)  
+    created_at = db.Column(db.DateTime, default=get_ist_time, index=True)  
     last_login = db.Column(db.DateTime)
     
     # Relationships
-    conversations = db.relationship('Conversation', backref='user', lazy=True, cascade='all, delete-orphan')
+    # Deleted in bulk by delete_user(); passive_deletes stops the ORM loading them first
+    conversations = db.relationship('Conversation', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
     def set_password(self, password):
         """Hash and set password"""
@@ -50,41 +61,88 @@ class User(db.Model):
 class Conversation(db.Model):
     """Conversation history for each user"""
     __tablename__ = 'conversations'
+    __table_args__ = (
+        db.Index('ix_conversations_user_updated', 'user_id', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
     title = db.Column(db.String(200), default='New Conversation')
     created_at = db.Column(db.DateTime, default=get_ist_time, index=True)  
-    updated_at = db.Column(db.DateTime, default=get_ist_time, onupdate=get_ist_time)  
+    updated_at = db.Column(db.DateTime, default=get_ist_time, onupdate=get_ist_time, index=True)  
+    
+    # Denormalized so listing conversations doesn't load their messages
+    message_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    last_message_preview = db.Column(db.String(60))
+    last_message_at = db.Column(db.DateTime)
+    
+    # Set when the messages were moved to archived_conversations
+    archived_at = db.Column(db.DateTime)
     
     # Relationships
-    messages = db.relationship('Message', backref='conversation', lazy=True, cascade='all, delete-orphan')
+    # Deleted in bulk by delete_conversations(); passive_deletes stops the ORM loading them first
+    messages = db.relationship('Message', backref='conversation', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
-    def to_dict(self):
-        message_count = len(self.messages)
-        last_message = self.messages[-1] if self.messages else None
+    def record_message(self, message, timestamp=None):
+        """Bump message_count and the last-message columns for a message added in this transaction"""
+        current = self.message_count
+        if self.id is None or current is None:
+            self.message_count = (current or 0) + 1
+        elif isinstance(current, int):
+            # Increment in SQL so concurrent turns on one conversation don't lose counts
+            self.message_count = Conversation.message_count + 1
+        else:
+            # Already holds a pending SQL increment from earlier in this turn
+            self.message_count = current + 1
         
+        self.last_message_preview = make_preview(message.content)
+        self.last_message_at = timestamp or get_ist_time()
+    
+    def to_dict(self):
         return {
             'id': self.id,
             'title': self.title,
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,  
             'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None,  
-            'message_count': message_count,
-            'preview': last_message.content[:50] + '...' if last_message and len(last_message.content) > 50 else (last_message.content if last_message else '')
+            'message_count': self.message_count or 0,
+            'preview': self.last_message_preview or '',
+            'archived': self.archived_at is not None
         }
 
 
 class Message(db.Model):
     """Individual messages in conversations"""
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Keyset pagination of a conversation's history by (timestamp, id)
+        db.Index('ix_messages_conversation_timestamp_id', 'conversation_id', 'timestamp', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), nullable=False, index=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer)  # Owner, copied from the conversation so search can filter by user
     sender = db.Column(db.String(10), nullable=False) 
     content = db.Column(db.Text, nullable=False)
     sentiment = db.Column(db.String(20))
     timestamp = db.Column(db.DateTime, default=get_ist_time, index=True)  
     
+    # Numeric analyze_emotion scores for user messages, so analytics don't re-run the NLP stack
+    intensity = db.Column(db.Float)
+    vader_score = db.Column(db.Float)
+    textblob_score = db.Column(db.Float)
+    subjectivity = db.Column(db.Float)
+    sklearn_confidence = db.Column(db.Float)
+    sentiment_model = db.Column(db.String(20))
+    
+    def set_sentiment_scores(self, sentiment_data):
+        """Store the numeric scores from SentimentAnalyzer.analyze_emotion"""
+        self.intensity = sentiment_data.get('intensity')
+        self.vader_score = sentiment_data.get('vader_score')
+        self.textblob_score = sentiment_data.get('textblob_score')
+        self.subjectivity = sentiment_data.get('subjectivity')
+        self.sklearn_confidence = sentiment_data.get('sklearn_confidence')
+        self.sentiment_model = sentiment_data.get('model_version')
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -129,3 +187,327 @@ class UserSession(db.Model):
     
     def __repr__(self):
         return f'<UserSession {self.user_id}>'
+
+
+
+class ArchivedConversation(db.Model):
+    """Cold storage: all of an inactive conversation's messages as one compressed JSON blob"""
+    __tablename__ = 'archived_conversations'
+    
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id', ondelete='CASCADE'), primary_key=True)
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    compression = db.Column(db.String(10), nullable=False, default='zlib')
+    data = db.Column(db.LargeBinary, nullable=False)
+    archived_at = db.Column(db.DateTime, default=get_ist_time)
+    # Distinct message sentiments as ",a,b," so filters can match them without unpacking the blob
+    sentiments = db.Column(db.String(200))
+
+
+class StatCounter(db.Model):
+    """Running row counts for the admin dashboard, updated in the same transaction as inserts/deletes"""
+    __tablename__ = 'stat_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SentimentBucket(db.Model):
+    """Pre-aggregated sentiment per hour/day, per user (user_id 0 = all users) and emotion"""
+    __tablename__ = 'sentiment_buckets'
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'user_id', 'bucket_start', 'emotion', name='uq_sentiment_bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(5), nullable=False)  # 'hour' or 'day'
+    user_id = db.Column(db.Integer, nullable=False, default=0)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    emotion = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    intensity_sum = db.Column(db.Float, nullable=False, default=0.0)
+    crisis_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# ============= READ-ONLY PROJECTIONS =============
+# Column selections for the list/history endpoints. They return plain rows
+# (no ORM objects, no identity map) already shaped like the to_dict() output,
+# with timestamps formatted by the database instead of strftime per row.
+
+def timestamp_text(column, name=None):
+    """A DateTime column as 'YYYY-MM-DD HH:MM:SS' text, formatted in SQL"""
+    return func.substr(cast(column, String), 1, 19).label(name or column.key)
+
+
+USER_COLUMNS = (
+    User.id,
+    User.username,
+    User.email,
+    User.is_admin,
+    timestamp_text(User.created_at),
+    timestamp_text(User.last_login)
+)
+
+CONVERSATION_COLUMNS = (
+    Conversation.id,
+    Conversation.title,
+    timestamp_text(Conversation.created_at),
+    timestamp_text(Conversation.updated_at),
+    func.coalesce(Conversation.message_count, 0).label('message_count'),
+    func.coalesce(Conversation.last_message_preview, '').label('preview'),
+    Conversation.archived_at.is_not(None).label('archived')
+)
+
+MESSAGE_COLUMNS = (
+    Message.id,
+    Message.sender,
+    Message.content,
+    Message.sentiment,
+    timestamp_text(Message.timestamp)
+)
+
+
+def rows_to_dicts(rows):
+    """Projection rows as JSON-ready dicts keyed by column label"""
+    return [dict(row._mapping) for row in rows]
+
+
+# ============= STATS ROLLUPS =============
+
+COUNTED_MODELS = {
+    User: 'total_users',
+    Conversation: 'total_conversations',
+    Message: 'total_messages'
+}
+
+
+def counter_connection(model):
+    """Connection to the database holding `model`'s rows (and so its counter)"""
+    return db.session.connection(bind_arguments={'mapper': inspect(model)})
+
+
+def adjust_stat_counters(connection, deltas):
+    """Apply {counter name: delta} increments on the given connection"""
+    for name, delta in deltas.items():
+        if delta:
+            connection.execute(
+                update(StatCounter)
+                .where(StatCounter.name == name)
+                .values(value=StatCounter.value + delta)
+            )
+
+
+@event.listens_for(db.session, 'after_flush')
+def track_stat_counters(session, flush_context):
+    """Keep stat_counters in step with ORM inserts and deletes"""
+    deltas = {}
+    for obj in session.new:
+        if type(obj) in COUNTED_MODELS:
+            deltas[type(obj)] = deltas.get(type(obj), 0) + 1
+    for obj in session.deleted:
+        if type(obj) in COUNTED_MODELS:
+            deltas[type(obj)] = deltas.get(type(obj), 0) - 1
+    
+    for model, delta in deltas.items():
+        connection = session.connection(bind_arguments={'mapper': inspect(model)})
+        adjust_stat_counters(connection, {COUNTED_MODELS[model]: delta})
+
+
+def count_rows(model):
+    """Row count for a counted model; archived messages still count as messages"""
+    count = db.session.execute(select(func.count()).select_from(model)).scalar()
+    if model is Message:
+        count += db.session.execute(
+            select(func.coalesce(func.sum(ArchivedConversation.message_count), 0))
+        ).scalar()
+    return count
+
+
+def store_stat_counter(connection, name, value):
+    """Set a counter on the given connection, creating it if needed"""
+    updated = connection.execute(
+        update(StatCounter).where(StatCounter.name == name).values(value=value)
+    ).rowcount
+    if not updated:
+        connection.execute(insert(StatCounter).values(name=name, value=value))
+
+
+def rebuild_stat_counters():
+    """Recount every counted table (on every shard) and store the totals"""
+    for model, name in COUNTED_MODELS.items():
+        for _ in each_shard_of(model.__tablename__):
+            store_stat_counter(counter_connection(model), name, count_rows(model))
+    db.session.commit()
+
+
+def seed_stat_counters():
+    """Create any missing counters from a one-off count of their table"""
+    for model, name in COUNTED_MODELS.items():
+        for _ in each_shard_of(model.__tablename__):
+            connection = counter_connection(model)
+            exists = connection.execute(select(StatCounter.name).where(StatCounter.name == name)).first()
+            if exists is None:
+                store_stat_counter(connection, name, count_rows(model))
+    db.session.commit()
+
+
+def get_stat_counters():
+    """All counters as a dict, summed across shards"""
+    counters = {}
+    for model, name in COUNTED_MODELS.items():
+        for _ in each_shard_of(model.__tablename__):
+            value = counter_connection(model).execute(
+                select(StatCounter.value).where(StatCounter.name == name)
+            ).scalar()
+            counters[name] = counters.get(name, 0) + (value or 0)
+    return counters
+
+
+# ============= BULK DELETES =============
+
+def delete_conversations(conversation_ids):
+    """Delete conversations and their messages with one statement per table
+
+    Children are deleted explicitly instead of relying on ON DELETE CASCADE,
+    which SQLite only honours with foreign_keys enabled and which databases
+    created before it was declared don't have. Runs in the caller's
+    transaction; returns (conversations, messages) deleted.
+    """
+    conversation_ids = list(conversation_ids)
+    if not conversation_ids:
+        return 0, 0
+    
+    messages = db.session.execute(
+        delete(Message).where(Message.conversation_id.in_(conversation_ids)),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    messages += db.session.execute(
+        select(func.coalesce(func.sum(ArchivedConversation.message_count), 0))
+        .where(ArchivedConversation.conversation_id.in_(conversation_ids))
+    ).scalar()
+    db.session.execute(
+        delete(ArchivedConversation).where(ArchivedConversation.conversation_id.in_(conversation_ids)),
+        execution_options={'synchronize_session': False}
+    )
+    conversations = db.session.execute(
+        delete(Conversation).where(Conversation.id.in_(conversation_ids)),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    
+    # Bulk deletes bypass the after_flush counter hook
+    adjust_stat_counters(counter_connection(Conversation), {
+        'total_conversations': -conversations,
+        'total_messages': -messages
+    })
+    return conversations, messages
+
+
+def delete_user(user_id):
+    """Delete a user with all their conversations, messages, sessions and per-user trend buckets"""
+    with user_shard(user_id):
+        conversation_ids = db.session.execute(
+            select(Conversation.id).where(Conversation.user_id == user_id)
+        ).scalars().all()
+        conversations, messages = delete_conversations(conversation_ids)
+        db.session.execute(delete(SentimentBucket).where(SentimentBucket.user_id == user_id))
+    
+    db.session.execute(delete(UserSession).where(UserSession.user_id == str(user_id)))
+    db.session.execute(delete(ConversationLog).where(ConversationLog.user_id == str(user_id)))
+    users = db.session.execute(
+        delete(User).where(User.id == user_id),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    
+    adjust_stat_counters(counter_connection(User), {'total_users': -users})
+    return users, conversations, messages
+
+
+# ============= SCHEMA MAINTENANCE =============
+
+def upgrade_schema(engine=None):
+    """Add columns and indexes that db.create_all() won't add to existing tables
+
+    Runs against the main database unless another engine (a shard) is given.
+    Returns a list of 'table.column' names that were added.
+    """
+    engine = engine or db.engine
+    inspector = inspect(engine)
+    added = []
+    
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            
+            existing = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}'
+                if column.server_default is not None:
+                    ddl += f" DEFAULT '{column.server_default.arg}'"
+                conn.execute(text(ddl))
+                added.append(f'{table.name}.{column.name}')
+            
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    
+    return added
+
+
+def backfill_conversation_stats(batch_size=500):
+    """Recompute message_count / last message columns from the messages table (archived conversations are skipped)"""
+    last_id = 0
+    updated = 0
+    
+    while True:
+        ids = db.session.execute(
+            select(Conversation.id)
+            .where(Conversation.id > last_id, Conversation.archived_at.is_(None))
+            .order_by(Conversation.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        
+        counts = dict(db.session.execute(
+            select(Message.conversation_id, func.count())
+            .where(Message.conversation_id.in_(ids))
+            .group_by(Message.conversation_id)
+        ).all())
+        
+        for conversation_id in ids:
+            last = db.session.execute(
+                select(Message.content, Message.timestamp)
+                .where(Message.conversation_id == conversation_id)
+                .order_by(Message.timestamp.desc(), Message.id.desc())
+                .limit(1)
+            ).first()
+            
+            db.session.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id)
+                .values(
+                    message_count=counts.get(conversation_id, 0),
+                    last_message_preview=make_preview(last.content) if last else None,
+                    last_message_at=last.timestamp if last else None,
+                    updated_at=Conversation.updated_at
+                )
+            )
+        
+        db.session.commit()
+        updated += len(ids)
+        last_id = ids[-1]
+    
+    return updated
+
+
+def backfill_message_user_ids():
+    """Copy conversations.user_id onto messages that don't have it yet"""
+    result = db.session.execute(text(
+        'UPDATE messages SET user_id = '
+        '(SELECT user_id FROM conversations WHERE conversations.id = messages.conversation_id) '
+        'WHERE user_id IS NULL'
+    ))
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,109 @@
+"""
+On-demand profiling of single requests
+
+An admin adds "X-Profile: 1" (or ?profile=1) to a request; while it runs a
+background thread samples the handling thread's Python stack every few
+milliseconds. The result is kept in a small per-worker ring and served as
+collapsed stacks ("frame;frame;frame count" per line), the input format of
+flamegraph.pl, speedscope and most other flame graph viewers.
+
+Requests without the flag only pay for the header/query lookup.
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every `interval` seconds from a background thread"""
+
+    def __init__(self, thread_id, interval=0.001, max_seconds=30.0):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self.duration = None
+
+        self._start = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling; safe to call more than once"""
+        if self.duration is None:
+            self._stopping.set()
+            self._thread.join()
+            self.duration = time.perf_counter() - self._start
+        return self
+
+    def _run(self):
+        """Take samples until stopped, the target thread exits or max_seconds pass"""
+        deadline = self._start + self.max_seconds
+        while not self._stopping.wait(self.interval):
+            if time.perf_counter() > deadline:
+                return
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            stack.reverse()
+
+            self.stacks[';'.join(stack)] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Collapsed stacks, heaviest first"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """Bounded ring of this worker's most recent profiles"""
+
+    def __init__(self, max_profiles=20):
+        self._profiles = deque(maxlen=max_profiles)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        """Id for a profile that is starting; includes the pid since every worker has its own ring"""
+        return f'{os.getpid()}-{next(self._ids)}'
+
+    def add(self, profile_id, profiler, **info):
+        """Keep a finished profile, dropping the oldest once full"""
+        with self._lock:
+            self._profiles.append({'id': profile_id, 'profiler': profiler, **info})
+
+    def get(self, profile_id):
+        with self._lock:
+            for profile in self._profiles:
+                if profile['id'] == profile_id:
+                    return profile
+        return None
+
+    def summaries(self):
+        """Metadata of the stored profiles, newest first"""
+        with self._lock:
+            profiles = list(self._profiles)
+        return [
+            {
+                **{key: value for key, value in profile.items() if key != 'profiler'},
+                'duration_ms': round(profile['profiler'].duration * 1000, 1),
+                'samples': profile['profiler'].samples
+            }
+            for profile in reversed(profiles)
+        ]
@@ -0,0 +1,165 @@
+"""
+Move users' conversation data onto the shard their user_id hashes to
+
+Run after enabling sharding (to move existing data off the main database)
+or after changing CONVERSATION_SHARDS, with the app stopped:
+
+    CONVERSATION_SHARDS=4 flask rebalance-shards
+
+Each user is copied to the target shard in one transaction and then removed
+from the source in another. Conversations and messages get new ids from the
+target shard's id range, and archived conversations come back as regular
+messages (the next archive run compacts them again). A crash between the two
+transactions leaves the user's rows on both shards; remove the target copy
+or restore from backup before re-running.
+"""
+from sqlalchemy import delete, inspect, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import Conversation, Message, ArchivedConversation, SentimentBucket, adjust_stat_counters, db
+from analytics import ALL_USERS
+from archive import unpack_messages
+from sharding import router, make_engine
+
+conversations_table = Conversation.__table__
+messages_table = Message.__table__
+archived_table = ArchivedConversation.__table__
+buckets_table = SentimentBucket.__table__
+
+
+def rebalance_sources(include_main=True):
+    """(name, engine, shard) for every database that may hold conversations; shard is None for main"""
+    sources = [('main', db.engine, None)] if include_main else []
+    sources += [(f'shard {shard}', engine, shard) for shard, engine in enumerate(router.engines)]
+    sources += [(f'shard {shard} (stale)', make_engine(url), shard) for shard, url in router.stale_shard_files()]
+    return sources
+
+
+def misplaced_users(engine, shard):
+    """User ids with rows on `engine` that belong on another shard"""
+    inspector = inspect(engine)
+    user_ids = set()
+    with engine.connect() as conn:
+        if inspector.has_table('conversations'):
+            user_ids.update(conn.execute(select(conversations_table.c.user_id).distinct()).scalars())
+        if inspector.has_table('sentiment_buckets'):
+            user_ids.update(conn.execute(
+                select(buckets_table.c.user_id).where(buckets_table.c.user_id != ALL_USERS).distinct()
+            ).scalars())
+    return sorted(user_id for user_id in user_ids if router.shard_for_user(user_id) != shard)
+
+
+def _add_bucket(conn, row, user_id):
+    """Add a bucket row's totals into the target shard's bucket for `user_id`"""
+    stmt = sqlite_insert(buckets_table).values(
+        granularity=row['granularity'],
+        user_id=user_id,
+        bucket_start=row['bucket_start'],
+        emotion=row['emotion'],
+        count=row['count'],
+        intensity_sum=row['intensity_sum'],
+        crisis_count=row['crisis_count']
+    )
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=['granularity', 'user_id', 'bucket_start', 'emotion'],
+        set_={
+            'count': buckets_table.c.count + row['count'],
+            'intensity_sum': buckets_table.c.intensity_sum + row['intensity_sum'],
+            'crisis_count': buckets_table.c.crisis_count + row['crisis_count']
+        }
+    ))
+
+
+def move_user(user_id, source_engine):
+    """Move one user's conversations, messages and trend buckets to their shard; returns (conversations, messages)"""
+    target_engine = router.engines[router.shard_for_user(user_id)]
+    has_archive = inspect(source_engine).has_table('archived_conversations')
+
+    with source_engine.connect() as src:
+        conversations = src.execute(
+            select(conversations_table).where(conversations_table.c.user_id == user_id).order_by(conversations_table.c.id)
+        ).mappings().all()
+        conversation_ids = [row['id'] for row in conversations]
+
+        messages = {}
+        for row in src.execute(
+            select(messages_table)
+            .where(messages_table.c.conversation_id.in_(conversation_ids))
+            .order_by(messages_table.c.timestamp, messages_table.c.id)
+        ).mappings():
+            messages.setdefault(row['conversation_id'], []).append(dict(row))
+        if has_archive:
+            for archived in src.execute(
+                select(archived_table).where(archived_table.c.conversation_id.in_(conversation_ids))
+            ):
+                messages.setdefault(archived.conversation_id, []).extend(unpack_messages(archived))
+
+        buckets = src.execute(select(buckets_table).where(buckets_table.c.user_id == user_id)).mappings().all()
+
+    moved_messages = sum(len(rows) for rows in messages.values())
+
+    # Copy into the target shard
+    with target_engine.begin() as dst:
+        for conversation in conversations:
+            values = {key: value for key, value in conversation.items() if key != 'id'}
+            rows = messages.get(conversation['id'], [])
+            values['archived_at'] = None
+            values['message_count'] = len(rows)
+            new_id = dst.execute(insert(conversations_table).values(**values)).inserted_primary_key[0]
+            if rows:
+                dst.execute(insert(messages_table), [
+                    {**{key: value for key, value in row.items() if key != 'id'}, 'conversation_id': new_id, 'user_id': user_id}
+                    for row in rows
+                ])
+        for bucket in buckets:
+            _add_bucket(dst, bucket, user_id)
+            _add_bucket(dst, bucket, ALL_USERS)
+        adjust_stat_counters(dst, {'total_conversations': len(conversations), 'total_messages': moved_messages})
+
+    # Then remove from the source
+    with source_engine.begin() as src:
+        src.execute(delete(messages_table).where(messages_table.c.conversation_id.in_(conversation_ids)))
+        if has_archive:
+            src.execute(delete(archived_table).where(archived_table.c.conversation_id.in_(conversation_ids)))
+        src.execute(delete(conversations_table).where(conversations_table.c.id.in_(conversation_ids)))
+        for bucket in buckets:
+            src.execute(
+                update(buckets_table)
+                .where(
+                    buckets_table.c.granularity == bucket['granularity'],
+                    buckets_table.c.user_id == ALL_USERS,
+                    buckets_table.c.bucket_start == bucket['bucket_start'],
+                    buckets_table.c.emotion == bucket['emotion']
+                )
+                .values(
+                    count=buckets_table.c.count - bucket['count'],
+                    intensity_sum=buckets_table.c.intensity_sum - bucket['intensity_sum'],
+                    crisis_count=buckets_table.c.crisis_count - bucket['crisis_count']
+                )
+            )
+        src.execute(delete(buckets_table).where(buckets_table.c.user_id == user_id))
+        adjust_stat_counters(src, {'total_conversations': -len(conversations), 'total_messages': -moved_messages})
+
+    return len(conversations), moved_messages
+
+
+def rebalance_shards(include_main=True, dry_run=False):
+    """Move every misplaced user to their shard; returns (users, conversations, messages) moved"""
+    if not router.enabled:
+        raise RuntimeError('Sharding is off; set CONVERSATION_SHARDS first')
+
+    totals = [0, 0, 0]
+    for name, engine, shard in rebalance_sources(include_main):
+        user_ids = misplaced_users(engine, shard)
+        if not user_ids:
+            continue
+        print(f"  ... {name}: {len(user_ids)} users to move")
+        if dry_run:
+            totals[0] += len(user_ids)
+            continue
+        for user_id in user_ids:
+            conversations, messages = move_user(user_id, engine)
+            totals[0] += 1
+            totals[1] += conversations
+            totals[2] += messages
+    return tuple(totals)
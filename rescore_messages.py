@@ -0,0 +1,182 @@
+"""
+Offline re-scoring of stored user messages
+
+Streams `messages` in primary-key order, scores each chunk across a process
+pool with the current SentimentAnalyzer and writes the new label and scores
+back with one executemany per chunk. Each chunk is its own short transaction
+and progress is checkpointed after it commits, so the job can be stopped and
+resumed, and the live app's SQLite writer is only held for one chunk at a time.
+
+The score columns are added by the app's upgrade_schema(), so start the app
+once against the database before running this job.
+
+Usage:
+    python rescore_messages.py
+    python rescore_messages.py --only-stale --workers 4 --batch-size 2000
+    python rescore_messages.py --reset          # ignore the checkpoint and start over
+
+A checkpoint belongs to one database and one model version. Resuming it
+against another --database is refused, and a checkpoint written by an older
+model is discarded so every message gets rescored.
+
+With CONVERSATION_SHARDS set, messages live in the shard files, so run the
+job once per shard, each with its own checkpoint:
+    python rescore_messages.py --database sqlite:///instance/shards/shard_0.db --checkpoint rescore_checkpoint_0.json
+    python rescore_messages.py --database sqlite:///instance/shards/shard_1.db --checkpoint rescore_checkpoint_1.json
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import create_engine, text
+
+from db_config import engine_options, configure_engine
+from sentiment_analyzer import SentimentAnalyzer
+
+DEFAULT_DATABASE = 'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'mindmend.db')
+
+UPDATE_SQL = text('''
+    UPDATE messages
+    SET sentiment = :emotion,
+        intensity = :intensity,
+        vader_score = :vader_score,
+        textblob_score = :textblob_score,
+        subjectivity = :subjectivity,
+        sklearn_confidence = :sklearn_confidence,
+        sentiment_model = :model_version
+    WHERE id = :id
+''')
+
+_analyzer = None
+
+
+def _init_worker():
+    """Build one SentimentAnalyzer per worker process"""
+    global _analyzer
+    _analyzer = SentimentAnalyzer()
+
+
+def score_batch(rows):
+    """Score (id, content) pairs; runs inside a worker process"""
+    results = []
+    for message_id, content in rows:
+        data = _analyzer.analyze_emotion(content)
+        results.append({
+            'id': message_id,
+            'emotion': data['emotion'],
+            'intensity': data.get('intensity'),
+            'vader_score': data.get('vader_score'),
+            'textblob_score': data.get('textblob_score'),
+            'subjectivity': data.get('subjectivity'),
+            'sklearn_confidence': data.get('sklearn_confidence'),
+            'model_version': data.get('model_version')
+        })
+    return results
+
+
+def load_checkpoint(path, database):
+    """Last processed message id and totals from a previous run against `database`"""
+    if not os.path.exists(path):
+        return {'database': database, 'last_id': 0, 'updated': 0}
+    with open(path) as f:
+        checkpoint = json.load(f)
+
+    if checkpoint.setdefault('database', database) != database:
+        raise SystemExit(
+            f"❌ {path} belongs to {checkpoint['database']}; "
+            f"use another --checkpoint for {database} (or --reset to discard it)"
+        )
+    if checkpoint.get('model_version') not in (None, SentimentAnalyzer.MODEL_VERSION):
+        print(f"✅ Checkpoint was written for model {checkpoint['model_version']}; rescoring everything")
+        checkpoint.update(last_id=0, updated=0)
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """Write the checkpoint atomically"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def fetch_chunk(engine, last_id, batch_size, only_stale):
+    """Next chunk of user messages after last_id"""
+    sql = '''
+        SELECT id, content FROM messages
+        WHERE id > :last_id AND sender = 'user'
+    '''
+    params = {'last_id': last_id, 'limit': batch_size}
+    if only_stale:
+        sql += ' AND (sentiment_model IS NULL OR sentiment_model != :model_version)'
+        params['model_version'] = SentimentAnalyzer.MODEL_VERSION
+    sql += ' ORDER BY id LIMIT :limit'
+
+    with engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(text(sql), params)]
+
+
+def split(rows, parts):
+    """Split rows into up to `parts` contiguous slices"""
+    size = max(1, -(-len(rows) // parts))
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+def rescore(database, batch_size, workers, checkpoint_path, only_stale, pause):
+    """Run the job until no rows are left"""
+    engine = configure_engine(create_engine(database, **engine_options(database)))
+    checkpoint = load_checkpoint(checkpoint_path, database)
+    checkpoint['model_version'] = SentimentAnalyzer.MODEL_VERSION
+
+    started = time.time()
+    print(f"✅ Rescoring from message id {checkpoint['last_id']} with model {SentimentAnalyzer.MODEL_VERSION}")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        while True:
+            rows = fetch_chunk(engine, checkpoint['last_id'], batch_size, only_stale)
+            if not rows:
+                break
+
+            results = []
+            for scored in pool.map(score_batch, split(rows, workers)):
+                results.extend(scored)
+
+            # One short write transaction per chunk
+            with engine.begin() as conn:
+                conn.execute(UPDATE_SQL, results)
+
+            checkpoint['last_id'] = rows[-1][0]
+            checkpoint['updated'] += len(results)
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            rate = checkpoint['updated'] / max(time.time() - started, 1e-9)
+            print(f"  ... {checkpoint['updated']} messages rescored (last id {checkpoint['last_id']}, {rate:.0f}/s)")
+
+            if pause:
+                time.sleep(pause)
+
+    print(f"✅ Done: {checkpoint['updated']} messages rescored")
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-score stored user messages with the current sentiment model')
+    parser.add_argument('--database', default=os.environ.get('DATABASE_URL', DEFAULT_DATABASE))
+    parser.add_argument('--batch-size', type=int, default=1000, help='Messages per read/write chunk')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Scoring processes')
+    parser.add_argument('--checkpoint', default='rescore_checkpoint.json', help='Checkpoint file for resuming')
+    parser.add_argument('--only-stale', action='store_true', help='Skip messages already scored by the current model')
+    parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between chunks to yield the writer')
+    parser.add_argument('--reset', action='store_true', help='Ignore an existing checkpoint')
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    rescore(args.database, args.batch_size, args.workers, args.checkpoint, args.only_stale, args.pause)
+
+
+if __name__ == '__main__':
+    main()
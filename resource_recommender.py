@@ -3,6 +3,8 @@ from sklearn.feature_extraction.text import CountVectorizer  # ===== ADD: Scikit
 from sklearn.metrics.pairwise import cosine_similarity  # ===== ADD: Scikit-learn =====
 import numpy as np  # ===== ADD: For ML calculations =====
 
+from metrics import timed
+
 
 class ResourceRecommender:
     """Recommends resources based on user emotion with real, working YouTube videos and detailed exercises"""
@@ -485,6 +487,7 @@ class ResourceRecommender:
             return []
     # ===== END: Scikit-learn matching =====
     
+    @timed('recommendation')
     def recommend_resources(self, emotion, mood_preference=None, user_context=None):
         """
         Recommend resources based on emotion
@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from models import db, Conversation, delete_conversations, get_ist_time
+from exporter import iter_export_records, iter_ndjson
+from archive import archive_inactive_conversations, prune_conversation_logs
+from sharding import each_shard
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so every process that starts the scheduler runs passes
+    fcntl = None
+
+RETENTION_ACTIONS = ('delete', 'archive')
+
+# How often a process that doesn't hold the scheduler lock checks whether it was released
+LOCK_RETRY_SECONDS = 60
+
+
+def iter_expired_batches(cutoff, batch_size):
+    """Yield ids of conversations not updated since `cutoff`, oldest ids first, one batch at a time"""
+    while True:
+        ids = db.session.execute(
+            select(Conversation.id)
+            .where(Conversation.updated_at < cutoff)
+            .order_by(Conversation.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return
+        yield ids
+
+
+def export_to_archive_file(conversation_ids, archive_dir):
+    """Append conversations to today's gzip NDJSON archive file
+
+    Each call writes a complete gzip member, and gzip readers treat
+    concatenated members as one stream.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"conversations-{get_ist_time():%Y-%m-%d}.ndjson.gz")
+    with open(path, 'ab') as f:
+        for chunk in iter_ndjson(iter_export_records(conversation_ids=conversation_ids), gzip=True):
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    return path
+
+
+def purge_expired_conversations(days, action='delete', archive_dir=None, batch_size=500, pause=0.0):
+    """Delete (or archive then delete) conversations idle for more than `days` days
+
+    Works in batches of `batch_size` conversations, each its own short
+    transaction, so the writer lock is only held briefly. Returns
+    (conversations, messages) removed.
+    """
+    if action not in RETENTION_ACTIONS:
+        raise ValueError(f'Unknown retention action: {action}')
+    if action == 'archive' and not archive_dir:
+        raise ValueError('archive_dir is required to archive conversations')
+
+    cutoff = get_ist_time() - timedelta(days=days)
+    total_conversations = 0
+    total_messages = 0
+
+    for _ in each_shard():
+        for ids in iter_expired_batches(cutoff, batch_size):
+            if action == 'archive':
+                export_to_archive_file(ids, archive_dir)
+
+            try:
+                conversations, messages = delete_conversations(ids)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            total_conversations += conversations
+            total_messages += messages
+            if pause:
+                time.sleep(pause)
+
+    return total_conversations, total_messages
+
+
+class RetentionScheduler:
+    """Background thread that applies the data lifecycle policy every `interval` seconds
+
+    Each pass moves conversations idle for `archive_days` into cold storage,
+    prunes legacy logs older than `log_days` and purges conversations idle
+    for `days`; a policy set to 0 is skipped.
+
+    Every web worker may start the scheduler, but only the process holding an
+    exclusive lock on `lock_path` runs passes; the others wait and take over
+    if it exits. Passes from two processes would archive the same
+    conversations twice.
+    """
+
+    def __init__(self, app, days=0, action='delete', archive_dir=None, batch_size=500, interval=24 * 3600,
+                 archive_days=0, log_days=0, lock_path=None):
+        self.app = app
+        self.days = days
+        self.archive_days = archive_days
+        self.log_days = log_days
+        self.action = action
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lock_path = lock_path
+        self.last_run = None
+        self.last_result = None
+        self.last_archived = None
+
+        self._thread = None
+        self._pid = None
+        self._lock_file = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start(self):
+        """Start the thread once per process; called per request, so the check is cheap once running"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Wait until this process holds the scheduler lock, then run a pass every `interval` seconds"""
+        while not self._acquire_lock():
+            if self._stopping.wait(LOCK_RETRY_SECONDS):
+                return
+        while not self._stopping.is_set():
+            self.run_once()
+            self._stopping.wait(self.interval)
+
+    def _acquire_lock(self):
+        """Take the lock file without blocking; it stays held until the process exits"""
+        if fcntl is None or not self.lock_path:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def run_once(self):
+        """Run one pass inside an app context"""
+        try:
+            with self.app.app_context():
+                if self.archive_days:
+                    self.last_archived = archive_inactive_conversations(self.archive_days, self.batch_size)
+                    if self.last_archived[0]:
+                        print(f"✅ Archived {self.last_archived[0]} conversations ({self.last_archived[1]} messages)")
+                if self.log_days:
+                    prune_conversation_logs(self.log_days)
+                if self.days:
+                    self.last_result = purge_expired_conversations(
+                        self.days, self.action, self.archive_dir, self.batch_size
+                    )
+                    conversations, messages = self.last_result
+                    if conversations:
+                        print(f"✅ Retention removed {conversations} conversations ({messages} messages)")
+            self.last_run = get_ist_time()
+        except Exception as e:
+            print(f"❌ Retention run failed: {str(e)}")
+
+    def stop(self):
+        """Stop after the current pass"""
+        self._stopping.set()
+
+    def stats(self):
+        """Policy and last run"""
+        return {
+            'days': self.days,
+            'action': self.action,
+            'archive_days': self.archive_days,
+            'log_days': self.log_days,
+            'runs_here': self._lock_file is not None or (fcntl is None and self._thread is not None),
+            'last_archived': self.last_archived[0] if self.last_archived else None,
+            'last_run': self.last_run.strftime('%Y-%m-%d %H:%M:%S') if self.last_run else None,
+            'last_removed': self.last_result[0] if self.last_result else None
+        }
@@ -0,0 +1,157 @@
+import html
+import re
+
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import OperationalError
+
+from models import db, Conversation, Message
+from sharding import router, each_shard
+
+# Markers around matched terms in snippets, swapped for <mark> after escaping
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+SEARCH_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content, user_id) VALUES (new.id, new.content, new.user_id);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, user_id) VALUES ('delete', old.id, old.content, old.user_id);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, user_id ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, user_id) VALUES ('delete', old.id, old.content, old.user_id);
+        INSERT INTO messages_fts(rowid, content, user_id) VALUES (new.id, new.content, new.user_id);
+    END''',
+]
+
+
+def search_available(engine=None):
+    """Full-text search needs SQLite with FTS5"""
+    return (engine or db.engine).dialect.name == 'sqlite'
+
+
+def setup_message_search(engine=None):
+    """Create the FTS5 index over messages and the triggers that keep it in sync
+
+    The index is an external-content table on `messages`, so message text is
+    not stored twice. Archiving a conversation deletes its message rows and so
+    drops them from the index; restoring it re-inserts and re-indexes them. Runs on the main database unless a shard engine is
+    given. Returns False when FTS5 isn't available.
+    """
+    engine = engine or db.engine
+    if not search_available(engine):
+        return False
+
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        )).first() is not None
+
+        try:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                "content, user_id, content='messages', content_rowid='id', tokenize='unicode61')"
+            ))
+        except OperationalError as e:
+            print(f"⚠️ Message search disabled, FTS5 unavailable: {str(e)}")
+            return False
+
+        for trigger in SEARCH_TRIGGERS:
+            conn.execute(text(trigger))
+
+        if not exists:
+            # Index the messages saved before search existed
+            conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+
+    return True
+
+
+def build_match_query(query, user_id=None):
+    """Turn free text into a safe FTS5 MATCH expression
+
+    Every word is quoted so FTS syntax in user input is treated literally, and
+    the last word is a prefix match so results show up while typing.
+    """
+    words = re.findall(r'\w+', query, flags=re.UNICODE)
+    if not words:
+        return None
+
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    match = 'content : (' + ' AND '.join(terms) + ')'
+
+    if user_id is not None:
+        match = f'user_id : "{int(user_id)}" AND ' + match
+    return match
+
+
+def render_snippet(snippet):
+    """Escape a snippet and turn match markers into <mark> tags"""
+    escaped = html.escape(snippet or '')
+    return escaped.replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def _ranked_matches(match, limit, offset):
+    """One database's matches, best first, with their bm25 rank"""
+    return db.session.execute(text(f'''
+        SELECT m.id, m.conversation_id, m.sender, m.sentiment, m.timestamp, m.user_id,
+               c.title,
+               snippet(messages_fts, 0, '{MATCH_START}', '{MATCH_END}', '…', 12) AS snippet,
+               bm25(messages_fts) AS rank
+        FROM messages_fts
+        JOIN messages m ON m.id = messages_fts.rowid
+        JOIN conversations c ON c.id = m.conversation_id
+        WHERE messages_fts MATCH :match
+        ORDER BY rank
+        LIMIT :limit OFFSET :offset
+    '''), {'match': match, 'limit': limit, 'offset': offset}, bind_arguments={'mapper': Message}).all()
+
+
+def count_archived_conversations(user_id=None):
+    """Archived conversations in a search's scope; search can't see their messages"""
+    query = select(func.count()).select_from(Conversation).where(Conversation.archived_at.is_not(None))
+    if user_id is not None:
+        query = query.where(Conversation.user_id == user_id)
+        return db.session.execute(query).scalar()
+    return sum(db.session.execute(query).scalar() for _ in each_shard())
+
+
+def search_messages(query, user_id=None, page=1, per_page=20):
+    """Ranked, paginated message search; user_id=None searches everyone's messages
+
+    A user's messages are on one shard, so callers select it with
+    user_shard(). Searching everyone on a sharded setup merges the top hits
+    of every shard by rank (bm25 statistics are per shard, so the merged
+    order is approximate).
+    """
+    match = build_match_query(query, user_id)
+    if match is None:
+        return []
+
+    offset = (page - 1) * per_page
+    if user_id is not None or not router.enabled:
+        rows = _ranked_matches(match, per_page, offset)
+    else:
+        rows = []
+        for _ in each_shard():
+            rows.extend(_ranked_matches(match, offset + per_page, 0))
+        rows = sorted(rows, key=lambda row: row.rank)[offset:offset + per_page]
+
+    results = []
+    for row in rows:
+        timestamp = row.timestamp
+        if isinstance(timestamp, str):
+            timestamp = timestamp[:19]
+        elif timestamp is not None:
+            timestamp = timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        results.append({
+            'message_id': row.id,
+            'conversation_id': row.conversation_id,
+            'conversation_title': row.title,
+            'user_id': row.user_id,
+            'sender': row.sender,
+            'sentiment': row.sentiment,
+            'timestamp': timestamp,
+            'snippet': render_snippet(row.snippet)
+        })
+    return results
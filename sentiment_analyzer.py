@@ -5,10 +5,15 @@ from sklearn.naive_bayes import MultinomialNB
 import numpy as np
 import re
 
+from metrics import timed
+
 
 class SentimentAnalyzer:
     """Sentiment analysis using VADER, TextBlob, and Scikit-learn"""
     
+    # Stored with every scored message; bump when scoring logic or training data changes
+    MODEL_VERSION = 'vader-tb-nb-1'
+    
     def __init__(self):
         self.vader = SentimentIntensityAnalyzer()
         
@@ -56,6 +61,7 @@ class SentimentAnalyzer:
         self.emotion_map = {0: 'negative', 1: 'positive', 2: 'anxious'}
         # ===== END: Scikit-learn setup =====
     
+    @timed('sentiment')
     def analyze_emotion(self, text):
         """
         Analyze emotion in text using combined approach
@@ -65,41 +71,46 @@ class SentimentAnalyzer:
             return {
                 'emotion': 'neutral',
                 'intensity': 0.0,
-                'subjectivity': 0.0
+                'subjectivity': 0.0,
+                'model_version': self.MODEL_VERSION
             }
         
         # Clean text
         text = text.lower().strip()
         
         # VADER analysis
-        vader_scores = self.vader.polarity_scores(text)
+        with timed('sentiment.vader'):
+            vader_scores = self.vader.polarity_scores(text)
         vader_compound = vader_scores['compound']
         
         # TextBlob analysis
-        try:
-            blob = TextBlob(text)
-            textblob_polarity = blob.sentiment.polarity
-            textblob_subjectivity = blob.sentiment.subjectivity
-        except:
-            textblob_polarity = 0.0
-            textblob_subjectivity = 0.5
+        with timed('sentiment.textblob'):
+            try:
+                blob = TextBlob(text)
+                textblob_polarity = blob.sentiment.polarity
+                textblob_subjectivity = blob.sentiment.subjectivity
+            except:
+                textblob_polarity = 0.0
+                textblob_subjectivity = 0.5
         
         # Check for mental health specific keywords
-        keyword_boost = self._check_keywords(text)
+        with timed('sentiment.keywords'):
+            keyword_boost = self._check_keywords(text)
         
         # Combined score with keyword adjustment
         combined_score = (vader_compound + textblob_polarity) / 2
         combined_score += keyword_boost
         
         # ===== ADD: Scikit-learn prediction =====
-        try:
-            text_vectorized = self.vectorizer.transform([text])
-            sklearn_pred = self.classifier.predict(text_vectorized)[0]
-            sklearn_emotion = self.emotion_map.get(sklearn_pred, 'neutral')
-            sklearn_confidence = self.classifier.predict_proba(text_vectorized)[0].max()
-        except:
-            sklearn_emotion = 'neutral'
-            sklearn_confidence = 0.5
+        with timed('sentiment.sklearn'):
+            try:
+                text_vectorized = self.vectorizer.transform([text])
+                sklearn_pred = self.classifier.predict(text_vectorized)[0]
+                sklearn_emotion = self.emotion_map.get(sklearn_pred, 'neutral')
+                sklearn_confidence = self.classifier.predict_proba(text_vectorized)[0].max()
+            except:
+                sklearn_emotion = 'neutral'
+                sklearn_confidence = 0.5
         
         # Combine scikit-learn with other methods
         # If scikit-learn is very confident, use it
@@ -122,7 +133,8 @@ class SentimentAnalyzer:
             'vader_score': vader_compound,
             'textblob_score': textblob_polarity,
             'sklearn_emotion': sklearn_emotion,  # ADD: Include ML prediction
-            'sklearn_confidence': round(sklearn_confidence, 2)  # ADD: Include confidence
+            'sklearn_confidence': round(sklearn_confidence, 2),  # ADD: Include confidence
+            'model_version': self.MODEL_VERSION
         }
     
     def _check_keywords(self, text):
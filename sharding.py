@@ -0,0 +1,194 @@
+"""
+Per-user sharding of conversation storage
+
+With CONVERSATION_SHARDS set, conversations, messages and the tables derived
+from them live in N SQLite files (SHARD_DIR/shard_<n>.db) and each user's rows
+go to the shard picked by a consistent hash of their user_id. Users, logs and
+other global tables stay on the main database. Every shard has its own
+writer lock, so chat turns of users on different shards commit in parallel.
+
+Routing happens in ShardedSession.get_bind(): queries touching a sharded
+table go to the shard selected with user_shard() / id_shard(), and raise if
+none is selected. Conversation and message ids in shard n start above
+n * SHARD_ID_SPAN, so an id alone identifies its shard.
+
+With sharding off every helper here is a no-op and all tables use the main
+database.
+"""
+import contextvars
+import os
+import re
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask_sqlalchemy.session import Session
+from sqlalchemy import MetaData, text
+from sqlalchemy.sql.util import find_tables
+
+from db_config import engine_options, configure_engine
+
+# Tables stored per shard; everything else stays on the main database
+SHARDED_TABLES = frozenset({'conversations', 'messages', 'archived_conversations', 'sentiment_buckets'})
+
+# stat_counters exists on every database and counts the rows stored there
+SHARD_LOCAL_TABLES = SHARDED_TABLES | {'stat_counters'}
+
+# Id ranges: shard n hands out ids above n * SHARD_ID_SPAN (well inside JS's safe integers)
+SHARD_ID_SPAN = 10 ** 12
+ID_RANGED_TABLES = ('conversations', 'messages')
+
+SHARD_FILE_PATTERN = re.compile(r'^shard_(\d+)\.db$')
+
+_current_shard = contextvars.ContextVar('current_shard', default=None)
+
+
+def jump_hash(key, buckets):
+    """Jump consistent hash: growing from N to N+1 buckets only moves 1/(N+1) of the keys"""
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def shard_url(shard_dir, shard):
+    """SQLite URL of a shard file"""
+    return 'sqlite:///' + os.path.join(shard_dir, f'shard_{shard}.db')
+
+
+def make_engine(url):
+    """Engine with the same pool and pragma setup as the main database"""
+    return configure_engine(sa.create_engine(url, **engine_options(url)))
+
+
+class ShardRouter:
+    """Maps users and row ids to shard engines"""
+
+    def __init__(self):
+        self.engines = []
+        self.shard_dir = None
+
+    def init_app(self, app):
+        """Open the shard engines configured by CONVERSATION_SHARDS / SHARD_DIR"""
+        count = app.config.get('CONVERSATION_SHARDS', 0)
+        if count <= 0:
+            return
+        self.shard_dir = app.config['SHARD_DIR']
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self.engines = [make_engine(shard_url(self.shard_dir, shard)) for shard in range(count)]
+
+    @property
+    def enabled(self):
+        return bool(self.engines)
+
+    @property
+    def count(self):
+        return len(self.engines)
+
+    def shard_for_user(self, user_id):
+        """Shard holding a user's conversations"""
+        return jump_hash(int(user_id), self.count)
+
+    def shard_for_id(self, row_id):
+        """Shard that issued a conversation/message id, or None if out of range"""
+        shard = int(row_id) // SHARD_ID_SPAN
+        return shard if 0 <= shard < self.count else None
+
+    def current_engine(self):
+        """Engine of the shard selected in this context"""
+        shard = _current_shard.get()
+        if shard is None:
+            raise RuntimeError('No shard selected for a sharded table; wrap the call in user_shard() or id_shard()')
+        return self.engines[shard]
+
+    def stale_shard_files(self):
+        """Shard files left over from a larger CONVERSATION_SHARDS, as (shard, url)"""
+        if not self.shard_dir or not os.path.isdir(self.shard_dir):
+            return []
+        stale = []
+        for name in sorted(os.listdir(self.shard_dir)):
+            match = SHARD_FILE_PATTERN.match(name)
+            if match and int(match.group(1)) >= self.count:
+                stale.append((int(match.group(1)), shard_url(self.shard_dir, int(match.group(1)))))
+        return stale
+
+    def create_schema(self, metadata):
+        """Create the shard tables in every shard and seed their id ranges"""
+        shard_metadata = MetaData()
+        for table in metadata.sorted_tables:
+            table.to_metadata(shard_metadata)
+        # AUTOINCREMENT makes SQLite honour the sqlite_sequence starting points below
+        for name in ID_RANGED_TABLES:
+            shard_metadata.tables[name].dialect_options['sqlite']['autoincrement'] = True
+        tables = [shard_metadata.tables[name] for name in sorted(SHARD_LOCAL_TABLES)]
+
+        for shard, engine in enumerate(self.engines):
+            shard_metadata.create_all(engine, tables=tables)
+            with engine.begin() as conn:
+                for name in ID_RANGED_TABLES:
+                    conn.execute(text(
+                        'INSERT INTO sqlite_sequence (name, seq) SELECT :name, :base '
+                        'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)'
+                    ), {'name': name, 'base': shard * SHARD_ID_SPAN})
+
+
+router = ShardRouter()
+
+
+@contextmanager
+def use_shard(shard):
+    """Route sharded tables to shard number `shard` inside the block"""
+    token = _current_shard.set(shard)
+    try:
+        yield shard
+    finally:
+        _current_shard.reset(token)
+
+
+def user_shard(user_id):
+    """Route sharded tables to a user's shard inside the block"""
+    return use_shard(router.shard_for_user(user_id) if router.enabled else None)
+
+
+def id_shard(row_id):
+    """Route sharded tables to the shard that issued a conversation/message id"""
+    return use_shard(router.shard_for_id(row_id) if router.enabled else None)
+
+
+def each_shard():
+    """Run a loop body once per shard with that shard selected (once, unrouted, when sharding is off)"""
+    if not router.enabled:
+        yield None
+        return
+    for shard in range(router.count):
+        with use_shard(shard):
+            yield shard
+
+
+def each_shard_of(table_name):
+    """each_shard() for a sharded table, a single pass for a main-database table"""
+    if table_name in SHARDED_TABLES:
+        yield from each_shard()
+    else:
+        yield None
+
+
+def _touches_sharded_table(mapper, clause):
+    """Whether a query's mapper or clause involves a sharded table"""
+    if mapper is not None and sa.inspect(mapper).local_table.name in SHARDED_TABLES:
+        return True
+    if clause is not None:
+        for table in find_tables(clause, check_columns=True, include_crud=True):
+            if getattr(table, 'name', None) in SHARDED_TABLES:
+                return True
+    return False
+
+
+class ShardedSession(Session):
+    """Flask-SQLAlchemy session that sends sharded tables to the selected shard"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and router.enabled and _touches_sharded_table(mapper, clause):
+            return router.current_engine()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -17,6 +17,14 @@ class AdminDashboard {
         this.conversationModal = document.getElementById('conversation-modal');
         this.closeModalBtn = document.getElementById('close-modal');
         this.modalBody = document.getElementById('modal-body');
+        this.usersPagination = document.getElementById('users-pagination');
+        this.conversationsPagination = document.getElementById('conversations-pagination');
+
+        this.pageSize = 50;
+        this.usersPage = 1;
+        this.usersQuery = '';
+        this.conversationsPage = 1;
+        this.searchTimer = null;
     }
 
     initializeEventListeners() {
@@ -45,14 +53,23 @@ class AdminDashboard {
             }
         });
 
-        // Search functionality
+        // Search functionality (users are searched server-side)
         document.getElementById('search-users').addEventListener('input', (e) => {
-            this.filterTable('users-table-body', e.target.value);
+            clearTimeout(this.searchTimer);
+            this.searchTimer = setTimeout(() => {
+                this.usersQuery = e.target.value.trim();
+                this.loadUsers(1);
+            }, 300);
         });
 
         document.getElementById('search-conversations').addEventListener('input', (e) => {
             this.filterTable('conversations-table-body', e.target.value);
         });
+
+        // Conversation filters
+        ['filter-sentiment', 'filter-start', 'filter-end'].forEach(id => {
+            document.getElementById(id).addEventListener('change', () => this.loadConversations(1));
+        });
     }
 
     switchTab(tabName) {
@@ -86,15 +103,19 @@ class AdminDashboard {
         }
     }
 
-    async loadUsers() {
+    async loadUsers(page = this.usersPage) {
         try {
-            const response = await fetch('/api/admin/users');
+            const params = new URLSearchParams({ page, per_page: this.pageSize });
+            if (this.usersQuery) params.set('q', this.usersQuery);
+
+            const response = await fetch(`/api/admin/users?${params}`);
             const data = await response.json();
 
+            this.usersPage = data.page;
             this.usersTableBody.innerHTML = '';
 
             if (data.users && data.users.length > 0) {
-                // Populate user select dropdown
+                // Populate user select dropdown with the current page
                 this.userSelect.innerHTML = '<option value="">Select a user...</option>';
                 
                 data.users.forEach(user => {
@@ -122,17 +143,36 @@ class AdminDashboard {
             } else {
                 this.usersTableBody.innerHTML = '<tr><td colspan="7" class="no-data">No users found</td></tr>';
             }
+
+            this.renderPagination(this.usersPagination, data, (p) => this.loadUsers(p));
         } catch (error) {
             console.error('Error loading users:', error);
             this.usersTableBody.innerHTML = '<tr><td colspan="7" class="no-data">Error loading users</td></tr>';
         }
     }
 
-    async loadConversations() {
+    conversationFilters() {
+        const params = new URLSearchParams();
+        const sentiment = document.getElementById('filter-sentiment').value;
+        const start = document.getElementById('filter-start').value;
+        const end = document.getElementById('filter-end').value;
+
+        if (sentiment) params.set('sentiment', sentiment);
+        if (start) params.set('start', start);
+        if (end) params.set('end', end);
+        return params;
+    }
+
+    async loadConversations(page = this.conversationsPage) {
         try {
-            const response = await fetch('/api/admin/conversations');
+            const params = this.conversationFilters();
+            params.set('page', page);
+            params.set('per_page', this.pageSize);
+
+            const response = await fetch(`/api/admin/conversations?${params}`);
             const data = await response.json();
 
+            this.conversationsPage = data.page;
             this.conversationsTableBody.innerHTML = '';
 
             if (data.conversations && data.conversations.length > 0) {
@@ -155,13 +195,37 @@ class AdminDashboard {
             } else {
                 this.conversationsTableBody.innerHTML = '<tr><td colspan="8" class="no-data">No conversations found</td></tr>';
             }
+
+            this.renderPagination(this.conversationsPagination, data, (p) => this.loadConversations(p));
         } catch (error) {
             console.error('Error loading conversations:', error);
             this.conversationsTableBody.innerHTML = '<tr><td colspan="8" class="no-data">Error loading conversations</td></tr>';
         }
     }
 
-    async loadUserDetails(userId) {
+    renderPagination(container, data, loadPage) {
+        container.innerHTML = '';
+        if (!data.pages || data.pages <= 1) return;
+
+        const prev = document.createElement('button');
+        prev.className = 'btn-view';
+        prev.textContent = '← Prev';
+        prev.disabled = data.page <= 1;
+        prev.addEventListener('click', () => loadPage(data.page - 1));
+
+        const label = document.createElement('span');
+        label.textContent = `Page ${data.page} of ${data.pages} (${data.total} total)`;
+
+        const next = document.createElement('button');
+        next.className = 'btn-view';
+        next.textContent = 'Next →';
+        next.disabled = data.page >= data.pages;
+        next.addEventListener('click', () => loadPage(data.page + 1));
+
+        container.append(prev, label, next);
+    }
+
+    async loadUserDetails(userId, page = 1) {
         if (!userId) {
             this.userDetailContent.innerHTML = '<p class="no-data">Select a user to view their conversations</p>';
             return;
@@ -171,15 +235,15 @@ class AdminDashboard {
         this.switchTab('user-details');
 
         try {
-            // Load user info
-            const usersResponse = await fetch('/api/admin/users');
-            const usersData = await usersResponse.json();
-            const user = usersData.users.find(u => u.id == userId);
-
-            // Load conversations
-            const convsResponse = await fetch('/api/admin/conversations');
+            // Load user summary and one page of their conversations
+            const [summaryResponse, convsResponse] = await Promise.all([
+                fetch(`/api/admin/users/${userId}`),
+                fetch(`/api/admin/conversations?user_id=${userId}&page=${page}&per_page=${this.pageSize}`)
+            ]);
+            const summary = await summaryResponse.json();
             const convsData = await convsResponse.json();
-            const userConversations = convsData.conversations.filter(c => c.username === user.username);
+            const user = summary.user;
+            const userConversations = convsData.conversations || [];
 
             // Display user info
             let html = `
@@ -204,7 +268,11 @@ class AdminDashboard {
                         </div>
                         <div class="info-item">
                             <div class="info-label">Total Conversations</div>
-                            <div class="info-value">${userConversations.length}</div>
+                            <div class="info-value">${summary.total_conversations}</div>
+                        </div>
+                        <div class="info-item">
+                            <div class="info-label">Total Messages</div>
+                            <div class="info-value">${summary.total_messages}</div>
                         </div>
                     </div>
                 </div>
@@ -231,9 +299,14 @@ class AdminDashboard {
                 html += '<p class="no-data">No conversations yet</p>';
             }
 
-            html += '</div>';
+            html += '</div><div class="pagination" id="user-conversations-pagination"></div>';
 
             this.userDetailContent.innerHTML = html;
+            this.renderPagination(
+                document.getElementById('user-conversations-pagination'),
+                convsData,
+                (p) => this.loadUserDetails(userId, p)
+            );
         } catch (error) {
             console.error('Error loading user details:', error);
             this.userDetailContent.innerHTML = '<p class="no-data">Error loading user details</p>';
@@ -249,21 +322,10 @@ class AdminDashboard {
 
             if (data.messages && data.messages.length > 0) {
                 let html = `<h3 style="margin-bottom: 20px; color: #667eea;">${data.conversation.title}</h3>`;
-                
-                data.messages.forEach(msg => {
-                    html += `
-                        <div class="message-item message-${msg.sender}">
-                            <div class="message-header">
-                                <span class="message-sender">${msg.sender === 'user' ? '👤 User' : '🤖 Bot'}</span>
-                                <span class="message-time">${this.formatDate(msg.timestamp)}</span>
-                            </div>
-                            <div class="message-content">${this.escapeHtml(msg.content)}</div>
-                            ${msg.sentiment ? `<div style="margin-top: 8px; font-size: 0.85rem; color: #999;">Sentiment: ${msg.sentiment}</div>` : ''}
-                        </div>
-                    `;
-                });
-
+                html += '<div id="modal-messages"></div>';
                 this.modalBody.innerHTML = html;
+
+                this.prependModalMessages(conversationId, data);
             } else {
                 this.modalBody.innerHTML = '<p class="no-data">No messages in this conversation</p>';
             }
@@ -275,6 +337,45 @@ class AdminDashboard {
         }
     }
 
+    prependModalMessages(conversationId, data) {
+        const container = document.getElementById('modal-messages');
+        document.getElementById('load-older-btn')?.remove();
+
+        let html = '';
+        data.messages.forEach(msg => {
+            html += `
+                <div class="message-item message-${msg.sender}">
+                    <div class="message-header">
+                        <span class="message-sender">${msg.sender === 'user' ? '👤 User' : '🤖 Bot'}</span>
+                        <span class="message-time">${this.formatDate(msg.timestamp)}</span>
+                    </div>
+                    <div class="message-content">${this.escapeHtml(msg.content)}</div>
+                    ${msg.sentiment ? `<div style="margin-top: 8px; font-size: 0.85rem; color: #999;">Sentiment: ${msg.sentiment}</div>` : ''}
+                </div>
+            `;
+        });
+        container.insertAdjacentHTML('afterbegin', html);
+
+        if (data.next_cursor) {
+            const button = document.createElement('button');
+            button.id = 'load-older-btn';
+            button.className = 'btn-view';
+            button.textContent = 'Load older messages';
+            button.addEventListener('click', () => this.loadOlderModalMessages(conversationId, data.next_cursor));
+            container.insertAdjacentElement('beforebegin', button);
+        }
+    }
+
+    async loadOlderModalMessages(conversationId, cursor) {
+        try {
+            const response = await fetch(`/api/conversations/${conversationId}?before=${encodeURIComponent(cursor)}`);
+            const data = await response.json();
+            this.prependModalMessages(conversationId, data);
+        } catch (error) {
+            console.error('Error loading older messages:', error);
+        }
+    }
+
     filterTable(tableBodyId, searchTerm) {
         const tableBody = document.getElementById(tableBodyId);
         const rows = tableBody.querySelectorAll('tr');
@@ -8,8 +8,12 @@ class ChatInterface {
         this.toggleSidebarBtn = document.getElementById('toggle-sidebar-btn');
         this.sidebar = document.getElementById('sidebar');
         this.conversationsList = document.getElementById('conversations-list');
+        this.searchInput = document.getElementById('search-messages');
+        this.searchTimeout = null;
         
         this.currentConversationId = null;
+        this.historyCursor = null;
+        this.loadingHistory = false;
         
         this.initializeEventListeners();
         this.loadConversations();
@@ -29,6 +33,17 @@ class ChatInterface {
         this.logoutBtn.addEventListener('click', () => this.logout());
         this.toggleSidebarBtn.addEventListener('click', () => this.toggleSidebar());
         
+        this.searchInput.addEventListener('input', () => {
+            clearTimeout(this.searchTimeout);
+            this.searchTimeout = setTimeout(() => this.searchMessages(), 300);
+        });
+        
+        this.chatMessages.addEventListener('scroll', () => {
+            if (this.chatMessages.scrollTop < 80) {
+                this.loadOlderMessages();
+            }
+        });
+        
         this.userInput.addEventListener('input', () => {
             this.userInput.style.height = 'auto';
             this.userInput.style.height = this.userInput.scrollHeight + 'px';
@@ -70,6 +85,68 @@ class ChatInterface {
         }
     }
     
+    async searchMessages() {
+        const query = this.searchInput.value.trim();
+        if (!query) {
+            this.loadConversations();
+            return;
+        }
+        
+        try {
+            const response = await fetch(`/api/search?q=${encodeURIComponent(query)}`);
+            const data = await response.json();
+            
+            if (!response.ok) {
+                this.conversationsList.innerHTML = `<div class="no-conversations">${data.error || 'Search failed'}</div>`;
+                return;
+            }
+            
+            this.conversationsList.innerHTML = '';
+            
+            if (data.results.length > 0) {
+                data.results.forEach(result => {
+                    this.addSearchResultToSidebar(result);
+                });
+            } else {
+                this.conversationsList.innerHTML = '<div class="no-conversations">No matching messages</div>';
+            }
+            
+            if (data.archived > 0) {
+                const note = document.createElement('div');
+                note.className = 'no-conversations';
+                note.textContent = `${data.archived} archived conversation(s) not searched. Send a message in one to restore it.`;
+                this.conversationsList.appendChild(note);
+            }
+        } catch (error) {
+            console.error('Error searching messages:', error);
+            this.conversationsList.innerHTML = '<div class="no-conversations">Search failed</div>';
+        }
+    }
+    
+    addSearchResultToSidebar(result) {
+        const resultDiv = document.createElement('div');
+        resultDiv.className = 'conversation-item search-result';
+        resultDiv.dataset.id = result.conversation_id;
+        
+        const title = document.createElement('div');
+        title.className = 'conversation-title';
+        title.textContent = result.conversation_title;
+        
+        // Snippet is escaped server-side; only <mark> tags are added
+        const snippet = document.createElement('div');
+        snippet.className = 'search-snippet';
+        snippet.innerHTML = result.snippet;
+        
+        const time = document.createElement('div');
+        time.className = 'conversation-time';
+        time.textContent = this.getTimeAgo(new Date(result.timestamp));
+        
+        resultDiv.append(title, snippet, time);
+        resultDiv.addEventListener('click', () => this.loadConversation(result.conversation_id));
+        
+        this.conversationsList.appendChild(resultDiv);
+    }
+    
     addConversationToSidebar(conversation) {
         const convDiv = document.createElement('div');
         convDiv.className = 'conversation-item';
@@ -107,35 +184,70 @@ class ChatInterface {
         this.conversationsList.appendChild(convDiv);
     }
     
-   async loadConversation(conversationId) {
-    try {
-        const response = await fetch(`/api/conversations/${conversationId}`);
-        const data = await response.json();
-        
-        this.currentConversationId = conversationId;
-        this.chatMessages.innerHTML = '';
-        
-        if (data.messages && data.messages.length > 0) {
-            data.messages.forEach(msg => {
-                this.displayMessage(msg.content, msg.sender, msg.sentiment);
+    async loadConversation(conversationId) {
+        try {
+            const response = await fetch(`/api/conversations/${conversationId}`);
+            const data = await response.json();
+            
+            this.currentConversationId = conversationId;
+            this.historyCursor = data.next_cursor || null;
+            this.chatMessages.innerHTML = '';
+            
+            if (data.messages && data.messages.length > 0) {
+                data.messages.forEach(msg => {
+                    this.displayMessage(msg.content, msg.sender, msg.sentiment);
+                });
+            }
+            
+            document.querySelectorAll('.conversation-item').forEach(item => {
+                item.classList.remove('active');
             });
+            document.querySelector(`[data-id="${conversationId}"]`)?.classList.add('active');
+            
+            if (window.innerWidth <= 768) {
+                this.toggleSidebar();
+            }
+            
+        } catch (error) {
+            console.error('Error loading conversation:', error);
+        }
+    }
+    
+    async loadOlderMessages() {
+        if (!this.historyCursor || this.loadingHistory || !this.currentConversationId) {
+            return;
         }
         
-        document.querySelectorAll('.conversation-item').forEach(item => {
-            item.classList.remove('active');
-        });
-        document.querySelector(`[data-id="${conversationId}"]`)?.classList.add('active');
+        this.loadingHistory = true;
+        const conversationId = this.currentConversationId;
         
-        if (window.innerWidth <= 768) {
-            this.toggleSidebar();
+        try {
+            const response = await fetch(`/api/conversations/${conversationId}?before=${encodeURIComponent(this.historyCursor)}`);
+            const data = await response.json();
+            
+            // Conversation changed while the page was loading
+            if (conversationId !== this.currentConversationId) {
+                return;
+            }
+            
+            this.historyCursor = data.next_cursor || null;
+            
+            // Prepend older messages while keeping the current view in place
+            const previousHeight = this.chatMessages.scrollHeight;
+            const fragment = document.createDocumentFragment();
+            (data.messages || []).forEach(msg => {
+                fragment.appendChild(this.createMessageElement(msg.content, msg.sender, msg.sentiment));
+            });
+            this.chatMessages.insertBefore(fragment, this.chatMessages.firstChild);
+            this.chatMessages.scrollTop += this.chatMessages.scrollHeight - previousHeight;
+            
+        } catch (error) {
+            console.error('Error loading older messages:', error);
+        } finally {
+            this.loadingHistory = false;
         }
-        
-    } catch (error) {
-        console.error('Error loading conversation:', error);
     }
-}
 
-    
     async deleteConversation(conversationId) {
         if (!confirm('Delete this conversation? This action cannot be undone.')) {
             return;
@@ -163,6 +275,7 @@ class ChatInterface {
     
     startNewChat() {
         this.currentConversationId = null;
+        this.historyCursor = null;
         this.chatMessages.innerHTML = `
             <div class="bot-message">
                 <div class="message-avatar">🤖</div>
@@ -189,7 +302,7 @@ class ChatInterface {
         this.showTypingIndicator();
         
         try {
-            const response = await fetch('/api/chat', {
+            const response = await fetch('/api/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -200,23 +313,19 @@ class ChatInterface {
                 })
             });
             
-            const data = await response.json();
-            
-            this.removeTypingIndicator();
-            
-            if (data.conversation_id) {
-                this.currentConversationId = data.conversation_id;
+            if (response.status === 429) {
+                // Rate limited: show the server's "slow down" message instead of the generic error
+                const data = await response.json();
+                this.removeTypingIndicator();
+                this.displayMessage(data.error, 'bot');
+                return;
             }
             
-            this.displayMessage(data.message, 'bot', data.sentiment);
-            
-            if (data.show_resources && data.resources) {
-                this.displayResourcesInChat(data.resources);
+            if (!response.ok || !response.body) {
+                throw new Error(`Chat request failed: ${response.status}`);
             }
             
-            if (data.is_crisis) {
-                this.displayEmergencyInChat(data.emergency_resources);
-            }
+            await this.readEventStream(response, (event, data) => this.handleChatEvent(event, data, message));
             
             this.loadConversations();
             
@@ -233,7 +342,86 @@ class ChatInterface {
         }
     }
     
+    async readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            
+            let boundary = buffer.indexOf('\n\n');
+            while (boundary !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let event = 'message';
+                let data = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                
+                if (data) onEvent(event, JSON.parse(data));
+                boundary = buffer.indexOf('\n\n');
+            }
+        }
+    }
+    
+    handleChatEvent(event, data, message) {
+        if (event === 'message') {
+            this.removeTypingIndicator();
+            this.displayMessage(data.message, 'bot', data.sentiment);
+            
+            if (data.is_crisis) {
+                this.displayEmergencyInChat(data.emergency_resources);
+            }
+        } else if (event === 'resources') {
+            this.displayResourcesInChat(data.resources);
+        } else if (event === 'meta') {
+            if (data.conversation_id) {
+                this.currentConversationId = data.conversation_id;
+            }
+            if (data.shed) {
+                this.displayResendPrompt(message);
+            }
+        } else if (event === 'error') {
+            this.removeTypingIndicator();
+            this.displayMessage(data.message, 'bot');
+        }
+    }
+    
+    displayResendPrompt(message) {
+        // Shed under load: the reply above was a stand-in and the message wasn't saved
+        const promptDiv = document.createElement('div');
+        promptDiv.className = 'bot-message';
+        promptDiv.innerHTML = `
+            <div class="message-avatar">🤖</div>
+            <div class="message-content" style="background: #fff8e1; border: 1px solid #ffb300;">
+                <p>I'm very busy right now, so your last message wasn't saved.</p>
+                <button type="button" class="resend-btn" style="margin-top: 8px; padding: 6px 12px; border: none; border-radius: 5px; background: #667eea; color: white; cursor: pointer;">Send again</button>
+            </div>
+        `;
+        
+        promptDiv.querySelector('.resend-btn').addEventListener('click', () => {
+            promptDiv.remove();
+            this.userInput.value = message;
+            this.sendMessage();
+        });
+        
+        this.chatMessages.appendChild(promptDiv);
+        this.scrollToBottom();
+    }
+    
     displayMessage(text, sender, sentiment = null) {
+        this.chatMessages.appendChild(this.createMessageElement(text, sender, sentiment));
+        this.scrollToBottom();
+    }
+    
+    createMessageElement(text, sender, sentiment = null) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `${sender}-message`;
         
@@ -251,8 +439,7 @@ class ChatInterface {
             </div>
         `;
         
-        this.chatMessages.appendChild(messageDiv);
-        this.scrollToBottom();
+        return messageDiv;
     }
     
     displayResourcesInChat(resources) {
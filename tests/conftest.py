@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py configures itself from the environment at import time, so point it at a scratch database first
+_scratch = tempfile.mkdtemp(prefix='mindmend-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_scratch, 'test.db')
+os.environ.setdefault('CONVERSATION_SHARDS', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """Sign up and log in a fresh user; returns their id"""
+    def login(username, password='test-pass-123'):
+        client.post('/api/auth/signup', json={
+            'username': username,
+            'email': f'{username}@example.com',
+            'password': password
+        })
+        response = client.post('/api/auth/login', json={'username': username, 'password': password})
+        assert response.status_code == 200
+        return response.get_json()['user']['id']
+    return login
@@ -0,0 +1,36 @@
+from archive import archive_conversations
+from models import db
+from sharding import user_shard
+
+
+def search(client, query):
+    response = client.get(f'/api/search?q={query}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_archived_conversation_leaves_search_and_returns_on_restore(app, client, login):
+    user_id = login('search_archive_user')
+    response = client.post('/api/chat', json={'message': 'My zephyrine garden makes me calm'})
+    assert response.status_code == 200
+    conversation_id = response.get_json()['conversation_id']
+
+    found = search(client, 'zephyrine')
+    assert [r['conversation_id'] for r in found['results']] == [conversation_id]
+    assert found['archived'] == 0
+
+    with app.app_context(), user_shard(user_id):
+        assert archive_conversations([conversation_id])[0] == 1
+        db.session.commit()
+
+    archived = search(client, 'zephyrine')
+    assert archived['results'] == []
+    assert archived['archived'] == 1
+
+    # New activity restores the conversation, which re-indexes its old messages
+    response = client.post('/api/chat', json={'message': 'Back again', 'conversation_id': conversation_id})
+    assert response.status_code == 200
+
+    restored = search(client, 'zephyrine')
+    assert [r['conversation_id'] for r in restored['results']] == [conversation_id]
+    assert restored['archived'] == 0
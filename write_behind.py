@@ -0,0 +1,140 @@
+import atexit
+import os
+import queue
+import threading
+
+from metrics import timed
+
+
+class WriteBehindQueue:
+    """Bounded in-process queue that batches non-critical inserts in a background thread"""
+
+    def __init__(self, db, app=None):
+        self.db = db
+        self.app = None
+        self.max_size = 10000
+        self.flush_interval = 1.0
+        self.batch_size = 200
+
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        # Counters, updated under _lock (enqueue runs on every request thread)
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read queue settings from app config"""
+        self.app = app
+        self.max_size = app.config.get('WRITE_BEHIND_MAX_SIZE', self.max_size)
+        self.flush_interval = app.config.get('WRITE_BEHIND_FLUSH_INTERVAL', self.flush_interval)
+        self.batch_size = app.config.get('WRITE_BEHIND_BATCH_SIZE', self.batch_size)
+        self._queue = queue.Queue(maxsize=self.max_size)
+        atexit.register(self.shutdown)
+
+    def enqueue(self, table, row):
+        """Queue a row for `table`; returns False (and counts a drop) when the queue is full"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((table, row))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _ensure_started(self):
+        """Start the flusher lazily so it runs in the worker process, not the gunicorn master"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Forked child: the parent's queue contents belong to the parent
+                self._queue = queue.Queue(maxsize=self.max_size)
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Flusher loop: collect up to batch_size rows or wait flush_interval, then write"""
+        while not self._stopping.is_set():
+            batch = self._collect(self.flush_interval)
+            if batch:
+                self._write(batch)
+
+    def _collect(self, timeout):
+        """Block up to `timeout` for the first row, then take whatever else is ready"""
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout))
+        except queue.Empty:
+            return batch
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        """Insert a batch with one executemany per table inside a single transaction"""
+        by_table = {}
+        for table, row in batch:
+            by_table.setdefault(table, []).append(row)
+
+        try:
+            with self.app.app_context(), timed('commit.log'):
+                with self.db.engine.begin() as conn:
+                    for table, rows in by_table.items():
+                        conn.execute(table.insert(), rows)
+            with self._lock:
+                self.written += len(batch)
+                self.batches += 1
+        except Exception as e:
+            with self._lock:
+                self.failed += len(batch)
+            print(f"❌ Write-behind flush failed ({len(batch)} rows dropped): {str(e)}")
+
+    def flush(self):
+        """Synchronously write everything currently queued"""
+        while True:
+            batch = self._collect(0)
+            if not batch:
+                break
+            self._write(batch)
+
+    def shutdown(self, timeout=5.0):
+        """Stop the flusher and drain the remaining rows"""
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        if self._queue is not None and self.app is not None and self._pid == os.getpid():
+            self.flush()
+
+    def stats(self):
+        """Queue depth and counters"""
+        return {
+            'depth': self._queue.qsize() if self._queue is not None else 0,
+            'max_size': self.max_size,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'batches': self.batches
+        }